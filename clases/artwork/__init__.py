@@ -0,0 +1,8 @@
+"""
+Artwork Module
+Background download of the images referenced by the NFO files
+"""
+
+from .artwork import ArtworkDownloader
+
+__all__ = ['ArtworkDownloader']
@@ -0,0 +1,331 @@
+"""
+Artwork Downloader
+Downloads NFO artwork (posters, banners, episode thumbnails) in the background
+with a shared keep-alive HTTP session
+"""
+
+import os
+import json
+import hashlib
+import threading
+import requests
+from io import BytesIO
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+from clases.config import config as c
+from clases.log import log as l
+from clases.library_index.library_index import cache_folder
+
+ytdlp2strm_config = c.config('./config/config.json').get_config()
+
+try:
+    workers = max(1, int(ytdlp2strm_config['ytdlp2strm_artwork_workers']))
+except:
+    workers = 4
+
+# original : keep JPEG/WebP/PNG as downloaded (.jpg/.webp/.png)
+# png      : convert everything to PNG, as older versions did
+artwork_format = str(ytdlp2strm_config.get('ytdlp2strm_artwork_format', 'original')).lower()
+try:
+    # Longest side in pixels, 0 keeps the original size
+    artwork_max_size = int(ytdlp2strm_config['ytdlp2strm_artwork_max_size'])
+except:
+    artwork_max_size = 0
+variant = f'{artwork_format}:{artwork_max_size}'
+
+class ArtworkDownloader:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_workers):
+        """
+        Initialize the downloader
+
+        Args:
+            max_workers (int): Images downloaded at the same time
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='artwork')
+        self.lock = threading.Lock()
+        # url -> {'paths': [...], 'done': bool, 'saved': path or None,
+        #         'fetched': result of fetch()}
+        self.jobs = {}
+        self.futures = []
+        self.store_file = os.path.join(cache_folder, 'artwork.json')
+        self.dirty = False
+        self.load()
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(workers)
+            return cls._instance
+
+    def load(self):
+        # image path -> source url, ETag, Last-Modified, sha256 of the source
+        # bytes, file written and its size/mtime
+        self.store = {}
+        if os.path.exists(self.store_file):
+            try:
+                with open(self.store_file, 'r', encoding='utf-8') as file:
+                    self.store = json.load(file)
+            except Exception as e:
+                l.log("nfo", f"Error reading {self.store_file}: {e}")
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.store_file), exist_ok=True)
+            temp_file = f'{self.store_file}.tmp'
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as file:
+                    json.dump(self.store, file)
+                os.replace(temp_file, self.store_file)
+                self.dirty = False
+            except Exception as e:
+                l.log("nfo", f"Error writing {self.store_file}: {e}")
+
+    def submit(self, url, path):
+        """
+        Queue an image to be saved. The same URL is only downloaded
+        once per run, every path that asked for it gets a copy. Images that
+        did not change since the last run are not written again.
+
+        Args:
+            url (str): Image URL
+            path (str): Destination file, the extension is replaced by the
+                        one of the stored format
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            job = self.jobs.get(url)
+            if job and not job['done']:
+                job['paths'].append(path)
+                return
+            if job and job['saved']:
+                self.futures.append(self.executor.submit(self.copy_if_changed, url, job, path))
+                return
+            job = {'paths': [path], 'done': False, 'saved': None, 'fetched': None}
+            self.jobs[url] = job
+            self.futures.append(self.executor.submit(self.download, url, job))
+
+    def intact(self, entry):
+        # The file on disk is still the one we wrote, with the current
+        # format settings
+        if entry.get('variant') != variant:
+            return False
+        try:
+            stat = os.stat(entry['file'])
+        except (FileNotFoundError, KeyError):
+            return False
+        return stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime']
+
+    def remember(self, path, url, fetched, file):
+        stat = os.stat(file)
+        with self.lock:
+            self.store[path] = {
+                'url': url,
+                'file': file,
+                'variant': variant,
+                'etag': fetched.get('etag'),
+                'last_modified': fetched.get('last_modified'),
+                'hash': fetched.get('hash'),
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns
+            }
+            self.dirty = True
+
+    def current(self, url, path):
+        # Stored entry of a path, only if it was made from this URL and the
+        # file was not touched since
+        with self.lock:
+            entry = self.store.get(path)
+        if entry and entry['url'] == url and self.intact(entry):
+            return entry
+        return None
+
+    def fetch(self, url, paths):
+        """
+        GET the image, conditional on the validators stored for one of the
+        paths that still holds it
+
+        Returns:
+            dict: status (200, 304 or None on error), content, hash, etag,
+                  last_modified and file (intact copy, for 304)
+        """
+        fetched = {'status': None}
+        headers = {}
+        for path in paths:
+            entry = self.current(url, path)
+            if entry and (entry['etag'] or entry['last_modified']):
+                fetched.update(entry)
+                if entry['etag']:
+                    headers['If-None-Match'] = entry['etag']
+                if entry['last_modified']:
+                    headers['If-Modified-Since'] = entry['last_modified']
+                break
+
+        try:
+            l.log("nfo", f"Attempting to download image from: {url}")
+            response = self.session.get(url, headers=headers, timeout=10)
+            if response.status_code == 304:
+                fetched['status'] = 304
+                return fetched
+            response.raise_for_status()
+        except requests.RequestException as e:
+            l.log("nfo", f"Failed to download image from {url}: {e}")
+            return fetched
+
+        fetched.update({
+            'status': 200,
+            'content': response.content,
+            'hash': hashlib.sha256(response.content).hexdigest(),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified')
+        })
+        return fetched
+
+    def encode(self, fetched):
+        """
+        Bytes to store and their extension. JPEG, WebP and PNG are kept as
+        downloaded unless they are bigger than artwork_max_size, anything
+        else (or artwork_format png) is converted to PNG.
+        """
+        if 'encoded' in fetched:
+            return fetched['encoded']
+        content = fetched['content']
+        kind = image_kind(content)
+        image = Image.open(BytesIO(content))
+        resize = artwork_max_size and max(image.size) > artwork_max_size
+        target = 'png' if artwork_format == 'png' or kind is None else kind
+        if target == kind and not resize:
+            fetched['encoded'] = (content, extensions[kind])
+            return fetched['encoded']
+
+        if resize:
+            image.thumbnail((artwork_max_size, artwork_max_size), Image.LANCZOS)
+        output = BytesIO()
+        if target == 'jpg':
+            image.convert('RGB').save(output, 'JPEG', quality=90)
+        elif target == 'webp':
+            image.save(output, 'WEBP', quality=90)
+        else:
+            image.save(output, 'PNG')
+        fetched['encoded'] = (output.getvalue(), extensions[target])
+        return fetched['encoded']
+
+    def write(self, url, path, fetched):
+        entry = self.current(url, path)
+        if fetched['status'] == 304:
+            if entry:
+                l.log("nfo", f"Image not modified: {entry['file']}")
+                return entry['file']
+            # Another path of the same URL holds the current image
+            return self.copy(fetched['file'], path, url, fetched)
+
+        if entry and entry['hash'] == fetched['hash']:
+            # Same bytes as last time, keep the file (and its mtime)
+            l.log("nfo", f"Image unchanged: {entry['file']}")
+            self.remember(path, url, fetched, entry['file'])
+            return entry['file']
+
+        try:
+            content, extension = self.encode(fetched)
+            file = os.path.splitext(path)[0] + extension
+            with open(file, 'wb') as output:
+                output.write(content)
+        except Exception as e:
+            l.log("nfo", f"Failed to save image from {url}: {e}")
+            return None
+        remove_siblings(file)
+        self.remember(path, url, fetched, file)
+        l.log("nfo", f"Image downloaded: {file}")
+        return file
+
+    def download(self, url, job):
+        with self.lock:
+            paths = list(job['paths'])
+        fetched = self.fetch(url, paths)
+
+        while True:
+            # Paths may still be added while the previous ones are written
+            with self.lock:
+                paths = job['paths']
+                job['paths'] = []
+                if not paths:
+                    job['done'] = True
+                    # Later paths of this URL are copied from job['saved']
+                    fetched.pop('content', None)
+                    fetched.pop('encoded', None)
+                    if not job['saved']:
+                        # Let a later request try again
+                        self.jobs.pop(url, None)
+                    return
+            if fetched['status'] is None:
+                continue
+            for path in paths:
+                file = self.write(url, path, fetched)
+                if file:
+                    job['saved'] = file
+                    job['fetched'] = fetched
+
+    def copy(self, source, path, url, fetched):
+        file = os.path.splitext(path)[0] + os.path.splitext(source)[1]
+        try:
+            with open(source, 'rb') as src, open(file, 'wb') as dst:
+                dst.write(src.read())
+        except Exception as e:
+            l.log("nfo", f"Failed to copy image {source} to {file}: {e}")
+            return None
+        remove_siblings(file)
+        self.remember(path, url, fetched, file)
+        return file
+
+    def copy_if_changed(self, url, job, path):
+        if not self.current(url, path):
+            self.copy(job['saved'], path, url, job['fetched'])
+
+    def drain(self):
+        """
+        Wait until every queued image is written. Called at the end of a
+        scan, before the media server is asked to refresh the library.
+        """
+        while True:
+            with self.lock:
+                futures = self.futures
+                self.futures = []
+                if not futures:
+                    # Next scan checks everything again
+                    self.jobs = {}
+                    break
+            wait(futures)
+        self.save()
+
+
+extensions = {'jpg': '.jpg', 'webp': '.webp', 'png': '.png'}
+
+def image_kind(content):
+    # Sniff the format from the first bytes, without decoding the image
+    if content[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if content[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if content[:4] == b'RIFF' and content[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def remove_siblings(file):
+    # poster.jpg replaces an older poster.png (or the other way around)
+    base, extension = os.path.splitext(file)
+    for other in extensions.values():
+        if other != extension:
+            try:
+                os.remove(base + other)
+            except FileNotFoundError:
+                pass
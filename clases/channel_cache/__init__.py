@@ -0,0 +1,8 @@
+"""
+Channel Cache Module
+Caches channel metadata (name, description, artwork) between scans
+"""
+
+from .channel_cache import ChannelCache
+
+__all__ = ['ChannelCache']
@@ -0,0 +1,98 @@
+"""
+Channel Metadata Cache
+Persistent per-plugin cache of channel name, description and artwork URLs
+"""
+
+import os
+import json
+import time
+import threading
+from clases.log import log as l
+from clases.library_index.library_index import cache_folder
+
+class ChannelCache:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, plugin):
+        """
+        Initialize the cache of a plugin
+
+        Args:
+            plugin (str): Plugin name, used to place the cache file
+        """
+        self.plugin = plugin
+        self.cache_file = os.path.join(cache_folder, plugin, 'channels.json')
+        self.lock = threading.Lock()
+        self.load()
+
+    @classmethod
+    def for_plugin(cls, plugin):
+        with cls._instances_lock:
+            if plugin not in cls._instances:
+                cls._instances[plugin] = cls(plugin)
+            return cls._instances[plugin]
+
+    def load(self):
+        with self.lock:
+            self.channels = {}
+            if os.path.exists(self.cache_file):
+                try:
+                    with open(self.cache_file, 'r', encoding='utf-8') as file:
+                        self.channels = json.load(file)
+                except Exception as e:
+                    l.log("channel_cache", f"Error reading {self.cache_file}: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        temp_file = f'{self.cache_file}.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(self.channels, file)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            l.log("channel_cache", f"Error writing {self.cache_file}: {e}")
+
+    def get(self, channel_url, ttl):
+        """
+        Get the cached metadata of a channel
+
+        Args:
+            channel_url (str): Channel URL, cache key
+            ttl (int): Seconds the cached metadata is valid
+
+        Returns:
+            dict: Metadata, or None if missing or expired
+        """
+        with self.lock:
+            entry = self.channels.get(channel_url)
+        if not entry or time.time() - entry['updated'] > ttl:
+            return None
+        return entry['metadata']
+
+    def set(self, channel_url, metadata):
+        """
+        Store fresh metadata of a channel
+
+        Returns:
+            bool: True if the metadata is different from the cached one
+        """
+        with self.lock:
+            entry = self.channels.get(channel_url)
+            changed = not entry or entry['metadata'] != metadata
+            self.channels[channel_url] = {
+                'updated': time.time(),
+                'metadata': metadata
+            }
+            self.save()
+        return changed
+
+    def clear(self):
+        """Forget every channel, the next scan fetches all metadata again"""
+        with self.lock:
+            self.channels = {}
+            try:
+                os.remove(self.cache_file)
+            except FileNotFoundError:
+                pass
+        l.log("channel_cache", f"Channel metadata cache cleared for {self.plugin}")
@@ -0,0 +1,8 @@
+"""
+Cookie Jar Module
+Cached export of the browser cookies shared by every yt-dlp call
+"""
+
+from .cookie_jar import CookieJar, cookie_args, copy_source, check_auth_error, remove_copies
+
+__all__ = ['CookieJar', 'cookie_args', 'copy_source', 'check_auth_error', 'remove_copies']
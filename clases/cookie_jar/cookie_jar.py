@@ -0,0 +1,247 @@
+"""
+Cookie Jar
+Exports the browser cookies once to a cached Netscape cookies.txt so yt-dlp
+calls use --cookies instead of decrypting the browser profile every time
+"""
+
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+from clases.config import config as c
+from clases.log import log as l
+from clases.library_index.library_index import cache_folder
+
+ytdlp2strm_config = c.config('./config/config.json').get_config()
+
+try:
+    # Seconds an export is used before reading the browser again, 0 passes
+    # --cookies-from-browser to every call like older versions
+    refresh_interval = int(ytdlp2strm_config['ytdlp2strm_cookies_refresh'])
+except:
+    refresh_interval = 21600
+
+# Auth errors refresh the export, at most once in this many seconds
+auth_refresh_interval = 300
+# A failed export is retried after this many seconds, meanwhile the calls
+# read the browser directly
+failed_retry = 600
+# Copies left behind by a killed process are deleted after this many seconds,
+# the others are deleted when their call returns (remove_copies)
+copy_lifetime = 86400
+
+cookies_folder = os.path.join(cache_folder, 'cookies')
+copies_folder = os.path.join(cookies_folder, 'copies')
+
+auth_errors = [
+    'Sign in to confirm',
+    'cookies are no longer valid',
+    'Use --cookies-from-browser or --cookies for the authentication',
+    'members-only content',
+    'Join this channel to get access',
+]
+
+BROWSER_PATTERN = re.compile(r'''(?x)
+    (?P<name>[^+:]+)
+    (?:\s*\+\s*(?P<keyring>[^:]+))?
+    (?:\s*:\s*(?!:)(?P<profile>.+?))?
+    (?:\s*::\s*(?P<container>.+))?
+''')
+
+class CookieJar:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, browser):
+        """
+        Initialize the jar of a browser
+
+        Args:
+            browser (str): --cookies-from-browser value, e.g. firefox or
+                           chrome:Profile 1
+        """
+        self.browser = browser
+        name = re.sub(r'[^A-Za-z0-9_-]', '_', browser)
+        self.cookies_file = os.path.join(cookies_folder, f'{name}.txt')
+        self.lock = threading.Lock()
+        self.stale = False
+        self.last_export = 0
+        self.failed_at = None
+
+    @classmethod
+    def for_browser(cls, browser):
+        with cls._instances_lock:
+            if browser not in cls._instances:
+                cls._instances[browser] = cls(browser)
+            return cls._instances[browser]
+
+    def export(self):
+        import yt_dlp.cookies
+
+        match = BROWSER_PATTERN.fullmatch(self.browser.strip())
+        if match is None:
+            raise ValueError(f'invalid cookies from browser value: {self.browser}')
+        name, keyring, profile, container = match.group('name', 'keyring', 'profile', 'container')
+        jar = yt_dlp.cookies.extract_cookies_from_browser(
+            name.lower(), profile,
+            keyring=keyring.upper() if keyring else None,
+            container=container
+        )
+
+        os.makedirs(cookies_folder, exist_ok=True)
+        # Readers open either the previous export or this one, never a
+        # half written file
+        temp_file = f'{self.cookies_file}.{os.getpid()}.tmp'
+        jar.save(temp_file)
+        os.replace(temp_file, self.cookies_file)
+        l.log("cookies", f"Exported {len(jar)} cookies from {self.browser} to {self.cookies_file}")
+        remove_old_copies()
+
+    def current(self, max_age=None):
+        """
+        Path of a fresh export, exporting the browser cookies first if the
+        export is missing, older than max_age (refresh_interval by default)
+        or marked stale
+
+        Returns:
+            str: cookies.txt path, None if the browser could not be read
+        """
+        if max_age is None:
+            max_age = refresh_interval
+        with self.lock:
+            try:
+                # Other processes refresh the same file
+                age = time.time() - os.path.getmtime(self.cookies_file)
+            except FileNotFoundError:
+                age = None
+            if age is not None and age < max_age and not self.stale:
+                return self.cookies_file
+            if self.failed_at and time.time() - self.failed_at < failed_retry:
+                return self.cookies_file if age is not None else None
+            try:
+                self.export()
+                self.stale = False
+                self.failed_at = None
+                self.last_export = time.time()
+            except Exception as e:
+                l.log("cookies", f"Error exporting cookies from {self.browser}: {e}")
+                self.failed_at = time.time()
+                if age is None:
+                    return None
+            return self.cookies_file
+
+    def copy(self):
+        """
+        Private copy of the export for one yt-dlp call. yt-dlp writes the
+        jar back to its --cookies file when it exits, so concurrent calls
+        never share a file and never overwrite the export.
+
+        Returns:
+            str: Path of the copy, None if the browser could not be read
+        """
+        cookies_file = self.current()
+        if cookies_file is None:
+            return None
+        os.makedirs(copies_folder, exist_ok=True)
+        try:
+            # The export and its version are part of the name, see copy_source
+            version = os.stat(cookies_file).st_mtime_ns
+            name = os.path.splitext(os.path.basename(cookies_file))[0]
+            copy_file = os.path.join(copies_folder, f'{name}.{version}.{uuid.uuid4().hex}.txt')
+            shutil.copyfile(cookies_file, copy_file)
+        except OSError as e:
+            l.log("cookies", f"Error copying {cookies_file}: {e}")
+            return None
+        return copy_file
+
+    def invalidate(self):
+        """Export again on the next call, unless it was just exported"""
+        with self.lock:
+            if time.time() - self.last_export > auth_refresh_interval:
+                self.stale = True
+                self.failed_at = None
+
+
+def refresh_cookies(stop_event):
+    """
+    Server thread: export again the browsers used so far a bit before their
+    exports expire, so playback requests don't wait for the browser
+    """
+    while not stop_event.is_set():
+        stop_event.wait(60)
+        with CookieJar._instances_lock:
+            jars = list(CookieJar._instances.values())
+        for jar in jars:
+            jar.current(max_age=max(refresh_interval - 300, 0))
+
+
+def cookie_args(option, value):
+    """
+    yt-dlp arguments of a plugin cookies config
+
+    Args:
+        option (str): cookies-from-browser or cookies
+        value (str): Browser or cookies file
+
+    Returns:
+        list: ['--cookies', file] with the cached export of the browser
+              cookies, the configured option if there is no export, or an
+              empty list without cookies
+    """
+    if not option or not value or not option.strip() or not value.strip():
+        return []
+    if option == 'cookies-from-browser' and refresh_interval > 0:
+        copy_file = CookieJar.for_browser(value).copy()
+        if copy_file:
+            return ['--cookies', copy_file]
+    return [f'--{option}', value]
+
+
+def copy_source(argument):
+    """
+    Same value for every copy of the same export, so the yt-dlp engine can
+    reuse its YoutubeDL instances across calls (and not after a refresh)
+    """
+    if os.path.dirname(argument) == copies_folder:
+        return argument.rsplit('.', 2)[0]
+    return argument
+
+
+def remove_copies(command):
+    """
+    Delete the private cookies copies of a finished yt-dlp call, they hold
+    the session cookies
+    """
+    for argument in command or []:
+        if isinstance(argument, str) and os.path.dirname(argument) == copies_folder:
+            try:
+                os.remove(argument)
+            except OSError:
+                pass
+
+
+def check_auth_error(stderr):
+    """
+    Mark the exports stale when yt-dlp reports an authentication problem
+    """
+    if stderr and any(error in stderr for error in auth_errors):
+        with CookieJar._instances_lock:
+            jars = list(CookieJar._instances.values())
+        for jar in jars:
+            jar.invalidate()
+
+
+def remove_old_copies():
+    now = time.time()
+    try:
+        entries = list(os.scandir(copies_folder))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > copy_lifetime:
+                os.remove(entry.path)
+        except OSError:
+            pass
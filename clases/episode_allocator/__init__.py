@@ -0,0 +1,8 @@
+"""
+Episode Allocator Module
+Allocates S{year}E{XX} episode numbers atomically across runs
+"""
+
+from .episode_allocator import EpisodeAllocator
+
+__all__ = ['EpisodeAllocator']
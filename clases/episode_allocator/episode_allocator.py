@@ -0,0 +1,185 @@
+"""
+Episode Allocator
+Hands out sequential episode numbers per (season folder, year) without
+walking the folder for every new video
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from clases.log import log as l
+from clases.library_index.library_index import cache_folder
+
+class EpisodeAllocator:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    # A lock file older than this is left over by a killed process
+    stale_lock_seconds = 30
+    # Seconds between checks of a counter against the files on disk
+    verify_seconds = 600
+    # A counter above the files on disk is only lowered this long after its
+    # last allocation, the numbers may be in use by a STRM being written
+    pending_seconds = 300
+
+    def __init__(self, store_file):
+        """
+        Initialize the allocator
+
+        Args:
+            store_file (str): JSON file with the last number of every
+                              (folder, year), shared by every ytdlp2STRM
+                              process
+        """
+        self.store_file = store_file
+        self.lock_file = f'{store_file}.lock'
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.store_mtime = None
+        # folder|year -> (time, folder inode) of the last walk
+        self.verified = {}
+        self.verified_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(os.path.join(cache_folder, 'episodes.json'))
+            return cls._instance
+
+    def acquire_file_lock(self):
+        # Lock between processes (cron run + run launched from the UI)
+        os.makedirs(os.path.dirname(self.lock_file), exist_ok=True)
+        while True:
+            try:
+                fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.close(fd)
+                return
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_file) > self.stale_lock_seconds:
+                        os.remove(self.lock_file)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+
+    def release_file_lock(self):
+        try:
+            os.remove(self.lock_file)
+        except FileNotFoundError:
+            pass
+
+    def reload(self):
+        # Only read the store again if another process wrote it
+        try:
+            mtime = os.stat(self.store_file).st_mtime_ns
+        except FileNotFoundError:
+            self.counters = {}
+            self.store_mtime = None
+            return
+        if mtime == self.store_mtime:
+            return
+        try:
+            with open(self.store_file, 'r', encoding='utf-8') as file:
+                self.counters = json.load(file)
+        except Exception as e:
+            l.log("episode_allocator", f"Error reading {self.store_file}: {e}")
+            self.counters = {}
+        self.store_mtime = mtime
+
+    def save(self):
+        temp_file = f'{self.store_file}.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as file:
+            json.dump(self.counters, file)
+        os.replace(temp_file, self.store_file)
+        self.store_mtime = os.stat(self.store_file).st_mtime_ns
+
+    def on_disk(self, folder_key, folder_path, year, inode, force=False):
+        """
+        Highest number on disk of a folder, walked at most every
+        verify_seconds (or when the folder was recreated). None if the
+        last walk is recent enough to trust the counter.
+        """
+        with self.verified_lock:
+            checked = self.verified.get(folder_key)
+        if not force and checked and checked[1] == inode and time.time() - checked[0] < self.verify_seconds:
+            return None
+        # Walked without the file lock, it can be slow on NFS
+        highest = get_max_episode_number(folder_path, year)
+        with self.verified_lock:
+            self.verified[folder_key] = (time.time(), inode)
+        return highest
+
+    def allocate(self, folder_path, year, count=1):
+        """
+        Reserve the next episode numbers of a season folder
+
+        Args:
+            folder_path (str): Folder that holds the episodes
+            year (int): Year of the S{year}E{XX} prefix
+            count (int): How many consecutive numbers to reserve
+
+        Returns:
+            int: First reserved number, the block is [first, first + count)
+        """
+        folder_key = os.path.normpath(os.path.abspath(folder_path))
+        year_key = str(year)
+        inode = folder_inode(folder_path)
+        highest = self.on_disk(f'{folder_key}|{year_key}', folder_path, year, inode)
+        with self.lock:
+            while True:
+                self.acquire_file_lock()
+                try:
+                    self.reload()
+                    entry = self.counters.get(folder_key)
+                    if not isinstance(entry, dict) or 'years' not in entry:
+                        # Older store: the years of the folder only
+                        entry = {'years': entry or {}, 'inode': inode, 'updated': {}}
+                    years = entry['years']
+                    if entry['inode'] != inode:
+                        # Folder deleted and created again, its old
+                        # numbers are gone
+                        entry = {'years': {}, 'inode': inode, 'updated': {}}
+                        years = entry['years']
+                    if highest is not None or year_key in years:
+                        self.counters[folder_key] = entry
+                        if highest is not None:
+                            if year_key not in years or highest > years[year_key]:
+                                years[year_key] = highest
+                            elif time.time() - entry['updated'].get(year_key, 0) > self.pending_seconds:
+                                # Episodes deleted since the last allocation
+                                years[year_key] = highest
+                        first = years[year_key] + 1
+                        years[year_key] += count
+                        entry['updated'][year_key] = time.time()
+                        self.save()
+                        return first
+                finally:
+                    self.release_file_lock()
+                # Not in the store (it was deleted), seed it from the disk
+                highest = self.on_disk(f'{folder_key}|{year_key}', folder_path, year, inode, force=True)
+
+def folder_inode(folder_path):
+    # Changes when the folder is deleted and created again
+    try:
+        stat = os.stat(folder_path)
+    except FileNotFoundError:
+        return None
+    return f'{stat.st_dev}:{stat.st_ino}'
+
+def get_max_episode_number(folder_path, year):
+    """
+    Highest S{year}E{XX} number of the .strm files inside a folder, 0 if none
+    """
+    pattern = re.compile(rf"S{year}E(\d+)")
+    max_episode = 0
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if file.endswith(".strm"):
+                match = pattern.search(file)
+                if match:
+                    max_episode = max(max_episode, int(match.group(1)))
+    return max_episode
@@ -4,6 +4,7 @@ import time
 import platform
 from clases.config import config as c
 from clases.log import log as l
+from clases.temp_media.temp_media import TempMedia
 import threading
 
 class folders:
@@ -121,11 +122,19 @@ class folders:
                 temp_path = os.path.join(path, 'temp')
                 now = time.time()
                 aria2_ffmpeg_files = ['.part', 'aria2', 'urls', '.temp', 'm4a', '.ytdl']
+                # Finished downloads (including .m4a audio) live as long as videos
+                media_files = TempMedia.shared().files()
 
                 for f in os.listdir(temp_path):
                     temp_file = os.path.join(temp_path, f)
                     if not f == "__init__.py":
-                        if any(keyword in f for keyword in aria2_ffmpeg_files):
+                        if temp_file in media_files:
+                            if os.path.isfile(temp_file) and self.modified_date(temp_file) < now - self.keep_downloaded:
+                                log_text = (f"Removing old video file: {temp_file}")
+                                l.log("folder", log_text)
+                                os.remove(temp_file)
+                                TempMedia.shared().forget(temp_file)
+                        elif any(keyword in f for keyword in aria2_ffmpeg_files):
                             if os.path.isfile(temp_file) and self.modified_date(temp_file) < now - self.temp_aria2_ffmpeg_files:
                                 log_text = (f"Removing old temporary file: {temp_file}")
                                 l.log("folder", log_text)
@@ -154,6 +154,44 @@ class JellyfinNotifier:
         
         return self.scan_library()
 
+    def notify_updated(self, paths):
+        """
+        Notify Jellyfin/Emby that some files changed, so it refreshes those
+        items only instead of scanning the whole library
+
+        Args:
+            paths (list): Paths of the changed files, as the server sees them
+
+        Returns:
+            bool: True if notification was successful, False otherwise
+        """
+        if not self.enabled or not paths:
+            return False
+
+        try:
+            # Endpoint is the same for both Jellyfin and Emby
+            url = f"{self.base_url}/Library/Media/Updated"
+            headers = {
+                'X-Emby-Token': self.api_key,
+                'Content-Type': 'application/json'
+            }
+            body = {
+                'Updates': [{'Path': path, 'UpdateType': 'Modified'} for path in paths]
+            }
+
+            response = requests.post(url, headers=headers, json=body, timeout=10)
+            response.raise_for_status()
+
+            l.log("jellyfin_notifier", f"Refresh requested for {len(paths)} updated items")
+            return True
+
+        except requests.exceptions.RequestException as e:
+            l.log("jellyfin_notifier", f"Error notifying updated items: {e}")
+            return False
+        except Exception as e:
+            l.log("jellyfin_notifier", f"Unexpected error notifying updated items: {e}")
+            return False
+
 
 # Convenience function for quick usage
 def notify_jellyfin(config, content_path=None):
@@ -0,0 +1,8 @@
+"""
+Library Index Module
+Keeps track of the video IDs already written as STRM files by each plugin
+"""
+
+from .library_index import LibraryIndex
+
+__all__ = ['LibraryIndex']
@@ -0,0 +1,237 @@
+"""
+Library Index
+Persistent per-plugin index of the video IDs already materialized as STRM files
+"""
+
+import os
+import json
+import hashlib
+import threading
+from clases.log import log as l
+
+cache_folder = os.path.abspath('./cache')
+# Bumped when the layout of the index file changes, older files are rebuilt
+index_version = 2
+
+class LibraryIndex:
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, plugin, media_folder):
+        """
+        Initialize the index for a plugin
+
+        Args:
+            plugin (str): Plugin name, used to place the index file
+            media_folder (str): strm_output_folder of the plugin
+        """
+        self.plugin = plugin
+        self.media_folder = media_folder
+        self.index_file = os.path.join(cache_folder, plugin, 'library_index.json')
+        self.lock = threading.RLock()
+        self.checked_folders = set()
+        self.dirty = False
+        self.load()
+
+    @classmethod
+    def for_plugin(cls, plugin, media_folder):
+        """
+        Get the shared index of a plugin, so every channel of a run works
+        against the same in-memory copy
+
+        Returns:
+            LibraryIndex: Index instance for (plugin, media_folder)
+        """
+        key = (plugin, media_folder)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(plugin, media_folder)
+            return cls._instances[key]
+
+    def start_run(self):
+        # Folders are checked against the disk once per to_strm run
+        with self.lock:
+            self.checked_folders = set()
+
+    def load(self):
+        data = None
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'r', encoding='utf-8') as file:
+                    data = json.load(file)
+            except Exception as e:
+                l.log("library_index", f"Error reading {self.index_file}: {e}")
+
+        if not data or data.get('media_folder') != self.media_folder or data.get('version') != index_version:
+            # Missing, unreadable, older or built for another media folder,
+            # every channel folder will be rescanned on first use
+            data = {'media_folder': self.media_folder, 'folders': {}, 'items': {}, 'sources': {}}
+            self.dirty = True
+
+        self.folders = data['folders']
+        # channel folder -> {video ID: {'path', 'season'}}, the same video
+        # can be in several folders (a channel and a playlist)
+        self.items = data['items']
+        # channel list entry -> channel folder its videos are written to
+        self.sources = data['sources']
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            temp_file = f'{self.index_file}.tmp'
+            try:
+                with open(temp_file, 'w', encoding='utf-8') as file:
+                    json.dump(
+                        {
+                            'version': index_version,
+                            'media_folder': self.media_folder,
+                            'folders': self.folders,
+                            'items': self.items,
+                            'sources': self.sources
+                        },
+                        file
+                    )
+                os.replace(temp_file, self.index_file)
+                self.dirty = False
+            except Exception as e:
+                l.log("library_index", f"Error writing {self.index_file}: {e}")
+
+    def folder_signature(self, folder_path):
+        """
+        Digest of the STRM names in the channel folder and in each season
+        folder, one listing per folder without reading any file. Artwork
+        and NFOs written next to them (in the background, or by the media
+        server) don't change it.
+        """
+        signature = {}
+        try:
+            signature['.'] = strm_digest(folder_path)
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        signature[entry.name] = strm_digest(entry.path)
+        except FileNotFoundError:
+            return {}
+        return signature
+
+    def scan_folder(self, folder_path):
+        l.log("library_index", f"Indexing {folder_path}")
+        # STRMs holding an upstream URL (strm_content upstream) are known by
+        # the refresher that writes them
+        from clases.upstream_strm.upstream_strm import registered_ids
+        upstream_ids = registered_ids(self.plugin)
+        self.items[folder_path] = {}
+
+        for root, dirs, files in os.walk(folder_path):
+            for file in files:
+                if file.endswith(".strm"):
+                    file_path = os.path.join(root, file)
+                    video_id = upstream_ids.get(os.path.normpath(file_path))
+                    try:
+                        if not video_id:
+                            with open(file_path, 'r', encoding='utf-8') as f:
+                                video_id = id_from_content(f.read())
+                    except Exception:
+                        continue
+                    if video_id:
+                        self.set_item(folder_path, video_id, file_path)
+
+        self.folders[folder_path] = self.folder_signature(folder_path)
+        self.dirty = True
+
+    def ensure_fresh(self, folder_path):
+        # Stat the folder once per run, rebuild its entries if something
+        # changed on disk that we did not write ourselves
+        if folder_path in self.checked_folders:
+            return
+        if self.folders.get(folder_path) != self.folder_signature(folder_path):
+            self.scan_folder(folder_path)
+        self.checked_folders.add(folder_path)
+
+    def set_item(self, folder_path, video_id, file_path):
+        file_path = os.path.normpath(file_path)
+        season_path = os.path.dirname(file_path)
+        # STRM directly in the channel folder (no season folder)
+        season = "" if season_path == folder_path else os.path.basename(season_path)
+        self.items.setdefault(folder_path, {})[video_id] = {
+            'path': file_path,
+            'season': season
+        }
+
+    def contains(self, video_id, folder_path):
+        """
+        Check if a video was already materialized inside a channel folder
+
+        Args:
+            video_id (str): Video ID as written in the STRM URL
+            folder_path (str): Channel folder
+
+        Returns:
+            bool: True if a STRM for the ID exists in the folder
+        """
+        folder_path = os.path.normpath(folder_path)
+        with self.lock:
+            self.ensure_fresh(folder_path)
+            return video_id in self.items.get(folder_path, {})
+
+    def get(self, video_id, folder_path):
+        folder_path = os.path.normpath(folder_path)
+        with self.lock:
+            return self.items.get(folder_path, {}).get(video_id)
+
+    def folder_of(self, source):
+        """
+        Channel folder the videos of a channel list entry were written to
+        in an earlier run, None if unknown (never scanned, or its videos go
+        to several folders, like a keyword search)
+        """
+        with self.lock:
+            return self.sources.get(source)
+
+    def set_folder(self, source, folder_path):
+        folder_path = os.path.normpath(folder_path)
+        with self.lock:
+            if self.sources.get(source) != folder_path:
+                self.sources[source] = folder_path
+                self.dirty = True
+
+    def add(self, video_id, file_path, folder_path):
+        """
+        Register a STRM written by the plugin
+
+        Args:
+            video_id (str): Video ID as written in the STRM URL
+            file_path (str): Path of the STRM file
+            folder_path (str): Channel folder that contains it
+        """
+        folder_path = os.path.normpath(folder_path)
+        with self.lock:
+            self.set_item(folder_path, video_id, file_path)
+            self.folders[folder_path] = self.folder_signature(folder_path)
+            self.dirty = True
+
+    def rebuild(self):
+        with self.lock:
+            self.folders = {}
+            self.items = {}
+            self.checked_folders = set()
+            self.dirty = True
+
+
+def strm_digest(folder_path):
+    with os.scandir(folder_path) as entries:
+        names = sorted(entry.name for entry in entries if entry.name.endswith('.strm'))
+    return hashlib.md5('\n'.join(names).encode('utf-8')).hexdigest()
+
+
+def id_from_content(content):
+    """
+    Extract the video ID from a STRM URL, e.g.
+    http://host:port/youtube/direct/<id> or http://host:port/twitch/direct/<channel>@<id>
+    """
+    content = content.strip()
+    if not content:
+        return None
+    return content.rstrip('/').rsplit('/', 1)[-1].split('@')[-1]
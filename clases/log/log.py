@@ -3,10 +3,30 @@ import datetime
 from flask_socketio import emit
 import sys
 import io
+import threading
 
 # Cambiar el codec por defecto a UTF-8
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', line_buffering=True)
 
+# Mensajes retenidos por hilo entre begin_group() y end_group()
+group = threading.local()
+group_lock = threading.Lock()
+
+def begin_group():
+    """Retiene los mensajes del hilo actual hasta end_group() para que salgan juntos"""
+    group.messages = []
+
+def end_group():
+    messages = getattr(group, 'messages', None)
+    group.messages = None
+    if messages:
+        with group_lock:
+            for message in messages:
+                print(message)
+            sys.stdout.flush()
+            with open('ytdlp2strm.log', 'a', encoding="utf-8") as file:
+                file.write('\n'.join(messages) + '\n')
+
 class log:
     def __init__(self, author, text):
         now = datetime.datetime.now()
@@ -16,6 +36,9 @@ class log:
         if author == 'ui':
             self.message = f'{text}'
         if self.message != "" and self.message:
+            if getattr(group, 'messages', None) is not None:
+                group.messages.append(self.message)
+                return
             print(self.message)
             sys.stdout.flush()  # Forzar el vaciado del buffer
             self.write()
@@ -0,0 +1,8 @@
+"""
+Metrics Module
+Request counters exposed on /metrics
+"""
+
+from .metrics import Metrics
+
+__all__ = ['Metrics']
@@ -0,0 +1,69 @@
+"""
+Metrics
+In-memory counters of the web server, exported in Prometheus text format
+"""
+
+import threading
+
+class Metrics:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> {labels tuple: value}
+        self.counters = {}
+        self.help = {}
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def describe(self, name, text):
+        """
+        Set the HELP text of a counter
+        """
+        with self.lock:
+            self.help[name] = text
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Add to a counter
+
+        Args:
+            name (str): Counter name, e.g. ytdlp2strm_requests_total
+            amount (float): Value to add
+            **labels: Label values of the series
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def value(self, name, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            return self.counters.get(name, {}).get(key, 0)
+
+    def render(self):
+        """
+        Counters in Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            for name in sorted(self.counters):
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(self.counters[name].items()):
+                    labels = ','.join(f'{label}="{escape(str(text))}"' for label, text in key)
+                    series = f'{name}{{{labels}}}' if labels else name
+                    lines.append(f'{series} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+def escape(text):
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
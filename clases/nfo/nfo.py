@@ -1,9 +1,7 @@
-import requests
 import html
 import re
-from PIL import Image
-from io import BytesIO
 from clases.folders import folders as f
+from clases.artwork.artwork import ArtworkDownloader
 from clases.log import log as l
 
 class nfo:
@@ -29,7 +27,10 @@ class nfo:
         
         l.log("nfo", "Creating NFO file...")
         # Rellenar la plantilla con los datos proporcionados
-        nfo_content = template.format(**self.nfo_data)
+        nfo_data = self.nfo_data
+        if self.nfo_type == "episode":
+            nfo_data = dict(nfo_data, streamdetails=stream_details(nfo_data))
+        nfo_content = template.format(**nfo_data)
 
         # Crear el archivo NFO
         f.folders().write_file_spaces(
@@ -40,6 +41,8 @@ class nfo:
         self.download_images(nfo_filename)
 
     def download_images(self, nfo_filename):
+        # The .png extension is replaced by the one of the stored image
+        # (see ytdlp2strm_artwork_format)
         try:
             if self.nfo_type == "tvshow":
                 self.download_image(self.nfo_data['poster'], f"{self.nfo_path}/poster.png")
@@ -57,21 +60,8 @@ class nfo:
             l.log("nfo", f"Skipping image download - no valid URL provided for {path}")
             return
         
-        try:
-            l.log("nfo", f"Attempting to download image from: {url}")
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()  # Check if the request was successful
-            
-            # Convertir a PNG
-            image = Image.open(BytesIO(response.content))
-            png_image_path = path
-            image.save(png_image_path, 'PNG')
-            
-            l.log("nfo", f"Image downloaded and converted to PNG: {path}")
-        except requests.RequestException as e:
-            l.log("nfo", f"Failed to download image from {url}: {e}")
-        except Exception as e:
-            l.log("nfo", f"Failed to convert image from {url} to PNG: {e}")
+        # Downloaded in the background, see ArtworkDownloader.drain()
+        ArtworkDownloader.shared().submit(url, path)
 
     tvshow_template = """<?xml version="1.0" encoding="UTF-8"?>
 <tvshow>
@@ -102,5 +92,72 @@ class nfo:
     <season>{season}</season>
     <episode>{episode}</episode>
     <thumb aspect="thumb" preview="{preview}">{preview}</thumb>
-</episodedetails>
-    """
\ No newline at end of file
+{streamdetails}</episodedetails>
+    """
+
+
+codec_names = [
+    ('avc', 'h264'), ('hev', 'hevc'), ('hvc', 'hevc'), ('vp09', 'vp9'), ('vp9', 'vp9'),
+    ('vp8', 'vp8'), ('av01', 'av1'), ('mp4a', 'aac'), ('opus', 'opus'), ('vorbis', 'vorbis'),
+    ('ec-3', 'eac3'), ('ac-3', 'ac3'), ('mp3', 'mp3'), ('flac', 'flac')
+]
+
+def codec_name(codec):
+    # yt-dlp codec strings (avc1.640028, mp4a.40.2...) to NFO codec names
+    if not codec or codec in ('none', 'NA'):
+        return None
+    codec = codec.lower()
+    for prefix, name in codec_names:
+        if codec.startswith(prefix):
+            return name
+    return codec.split('.')[0]
+
+def number(value):
+    try:
+        return float(value) if value not in (None, 'NA', '') else None
+    except (TypeError, ValueError):
+        return None
+
+def stream_details(data):
+    """
+    <runtime> and <fileinfo><streamdetails> lines of an episode NFO from the
+    optional duration, width, height, vcodec and acodec of the video, so the
+    media server does not need to probe the STRM. Empty if none is known.
+    """
+    duration = number(data.get('duration'))
+    width = number(data.get('width'))
+    height = number(data.get('height'))
+    vcodec = codec_name(data.get('vcodec'))
+    acodec = codec_name(data.get('acodec'))
+
+    video = []
+    if vcodec:
+        video.append(f'<codec>{vcodec}</codec>')
+    if width and height:
+        video.append(f'<aspect>{width / height:.2f}</aspect>')
+        video.append(f'<width>{int(width)}</width>')
+        video.append(f'<height>{int(height)}</height>')
+    if duration and video:
+        video.append(f'<durationinseconds>{int(duration)}</durationinseconds>')
+
+    details = []
+    if video:
+        details.append('            <video>')
+        details.extend(f'                {line}' for line in video)
+        details.append('            </video>')
+    if acodec:
+        details.append('            <audio>')
+        details.append(f'                <codec>{acodec}</codec>')
+        details.append('            </audio>')
+
+    lines = []
+    if duration:
+        # Minutes, as Kodi and Jellyfin read it
+        lines.append(f'    <runtime>{max(1, round(duration / 60))}</runtime>')
+    if details:
+        lines.append('    <fileinfo>')
+        lines.append('        <streamdetails>')
+        lines.extend(details)
+        lines.append('        </streamdetails>')
+        lines.append('    </fileinfo>')
+    return ''.join(f'{line}\n' for line in lines)
@@ -0,0 +1,8 @@
+"""
+Prewarm Module
+Resolves newly added videos in the background before their first play
+"""
+
+from .prewarm import Prewarmer
+
+__all__ = ['Prewarmer']
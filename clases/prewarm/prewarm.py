@@ -0,0 +1,81 @@
+"""
+Prewarm
+Background, low priority queue that resolves videos ahead of their first
+play, pausing while live playback requests are being served
+"""
+
+import time
+import threading
+from queue import Queue
+from contextlib import contextmanager
+from clases.log import log as l
+
+class Prewarmer:
+    def __init__(self, name, function, workers=1, pause=1.0):
+        """
+        Initialize the prewarmer
+
+        Args:
+            name (str): Name used in the log
+            function (callable): Called with each queued key
+            workers (int): Keys resolved at the same time
+            pause (float): Seconds each worker rests between keys
+        """
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+        self.pause = pause
+        self.queue = Queue()
+        self.queued = set()
+        self.condition = threading.Condition()
+        self.live_requests = 0
+        self.threads = []
+
+    def submit(self, keys):
+        """
+        Queue keys to be resolved in the background
+
+        Args:
+            keys (list): Keys, e.g. video IDs
+        """
+        with self.condition:
+            keys = [key for key in keys if key not in self.queued]
+            self.queued.update(keys)
+            if not self.threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self.work, name=f'{self.name}-prewarm-{i}', daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+        for key in keys:
+            self.queue.put(key)
+        if keys:
+            l.log(self.name, f"Prewarming {len(keys)} videos in the background")
+
+    @contextmanager
+    def live(self):
+        """
+        Mark a live playback request, prewarm work waits until it ends
+        """
+        with self.condition:
+            self.live_requests += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.live_requests -= 1
+                self.condition.notify_all()
+
+    def work(self):
+        while True:
+            key = self.queue.get()
+            with self.condition:
+                # Playback first
+                self.condition.wait_for(lambda: self.live_requests == 0)
+            try:
+                self.function(key)
+            except Exception as e:
+                l.log(self.name, f"Error prewarming {key}: {e}")
+            finally:
+                with self.condition:
+                    self.queued.discard(key)
+            time.sleep(self.pause)
@@ -0,0 +1,8 @@
+"""
+Probe Module
+Cheap answers for media server probes of the STRM URLs
+"""
+
+from .probe import is_probe, light_response, count
+
+__all__ = ['is_probe', 'light_response', 'count']
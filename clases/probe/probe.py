@@ -0,0 +1,54 @@
+"""
+Probe Detection
+Tells media server probes (HEAD, ffprobe) apart from playback
+requests on the STRM URLs, so probes don't trigger a yt-dlp extraction
+"""
+
+from flask import Response
+from clases.config import config as c
+from clases.metrics.metrics import Metrics
+
+ytdlp2strm_config = c.config('./config/config.json').get_config()
+
+# False resolves probes like playback requests
+probe_fast_path = str(ytdlp2strm_config.get('ytdlp2strm_probe_fast_path', 'True')).lower() != 'false'
+# User-Agent substrings of probe tools, separated by ;
+probe_user_agents = [
+    agent.strip().lower()
+    for agent in str(ytdlp2strm_config.get('ytdlp2strm_probe_user_agents', 'ffprobe')).split(';')
+    if agent.strip()
+]
+Metrics.shared().describe(
+    'ytdlp2strm_requests_total',
+    'STRM URL requests by plugin, route, kind (probe or play) and answer (cached, light or resolved)'
+)
+
+def is_probe(request):
+    """
+    True for HEAD requests and probe tool User-Agents. Small ranges at the
+    start of the file are not probes, players (AVPlayer) start playback
+    with bytes=0-1
+    """
+    if not probe_fast_path:
+        return False
+    if request.method == 'HEAD':
+        return True
+    user_agent = (request.headers.get('User-Agent') or '').lower()
+    return any(agent in user_agent for agent in probe_user_agents)
+
+def light_response(request, mimetype):
+    """
+    Answer of a probe whose video is not resolved yet, without resolving
+    it: HEAD gets the headers a playback request would get, other probes
+    are asked to retry (the media server probes again when it plays)
+    """
+    if request.method == 'HEAD':
+        response = Response(status=200, mimetype=mimetype)
+    else:
+        response = Response('Not resolved yet, the video is resolved on playback.', status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = '5'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def count(plugin, route, kind, answer):
+    Metrics.shared().increment('ytdlp2strm_requests_total', plugin=plugin, route=route, kind=kind, answer=answer)
@@ -0,0 +1,8 @@
+"""
+Progressive Module
+Range-aware serving of files that are still being downloaded
+"""
+
+from .progressive import ProgressiveDownload, sniff_audio
+
+__all__ = ['ProgressiveDownload', 'sniff_audio']
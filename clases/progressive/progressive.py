@@ -0,0 +1,272 @@
+"""
+Progressive Download
+Serves a file while a process is still writing it, with HTTP Range support,
+and leaves the finished file in the temp folder
+"""
+
+import os
+import time
+import threading
+import subprocess
+from flask import Response, send_file
+from clases.log import log as l
+from clases.worker import worker as w
+from clases.cookie_jar.cookie_jar import remove_copies
+
+chunk_size = 256 * 1024
+# Seconds a reader waits for bytes that are not downloaded yet
+wait_timeout = 120
+
+class ProgressiveDownload:
+    _downloads = {}
+    _downloads_lock = threading.Lock()
+
+    def __init__(self, key, command, final_path, on_finished=None, remux=False, sniff=None):
+        """
+        Initialize a download
+
+        Args:
+            key (str): Download key (video ID), one download per key
+            command (list): Command that writes the media to stdout
+            final_path (str): File left in place once finished
+            on_finished (callable): Called with final_path after a
+                                    successful download
+            remux (bool): Remux the finished file with ffmpeg before it is
+                          kept. A container written to a pipe has no
+                          index (cues) nor duration, seeking needs them
+            sniff (callable): First bytes -> (extension, mimetype) of the
+                              media, when the command may pick one of
+                              several containers. Replaces the extension of
+                              final_path and the mimetype of the responses
+        """
+        self.key = key
+        self.command = command
+        self.final_path = final_path
+        self.on_finished = on_finished
+        self.remux = remux
+        self.sniff = sniff
+        self.mimetype = None
+        self.part_path = f'{final_path}.part'
+        self.size = 0
+        self.finished = False
+        self.failed = False
+        self.condition = threading.Condition()
+
+    @classmethod
+    def get(cls, key, command, final_path, on_finished=None, remux=False, sniff=None):
+        """
+        Get the running download of a key or start it
+
+        Returns:
+            ProgressiveDownload: Running (or just finished) download
+        """
+        with cls._downloads_lock:
+            download = cls._downloads.get(key)
+            if download is None:
+                download = cls(key, command, final_path, on_finished, remux, sniff)
+                if os.path.isfile(final_path):
+                    # Already in the temp media cache
+                    download.finished = True
+                    return download
+                cls._downloads[key] = download
+                download.start()
+            return download
+
+    @classmethod
+    def running(cls, key):
+        """True while the download of a key is in progress"""
+        with cls._downloads_lock:
+            return key in cls._downloads
+
+    def start(self):
+        l.log("progressive", f"Downloading {self.key} to {self.final_path}")
+        # Created before any reader opens it
+        self.output = open(self.part_path, 'wb')
+        self.process = w.worker(self.command).pipe()
+        threading.Thread(target=self.copy, daemon=True).start()
+
+    def copy(self):
+        try:
+            with self.output as output:
+                while True:
+                    data = self.process.stdout.read1(chunk_size)
+                    if not data:
+                        break
+                    output.write(data)
+                    output.flush()
+                    if self.sniff and self.size == 0:
+                        self.sniff_container(data)
+                    with self.condition:
+                        self.size += len(data)
+                        self.condition.notify_all()
+            ok = self.process.wait() == 0 and self.size > 0
+            remove_copies(self.command)
+            if ok:
+                ok = self.replace_part()
+        except Exception as e:
+            l.log("progressive", f"Error downloading {self.key}: {e}")
+            ok = False
+        if not ok:
+            l.log("progressive", f"Download of {self.key} failed")
+            try:
+                os.remove(self.part_path)
+            except OSError:
+                pass
+
+        with self.condition:
+            self.finished = ok
+            self.failed = not ok
+            self.condition.notify_all()
+        with self._downloads_lock:
+            self._downloads.pop(self.key, None)
+
+    def sniff_container(self, head):
+        # Before the first byte is announced, readers wait for it
+        container = self.sniff(head)
+        if container:
+            extension, self.mimetype = container
+            self.final_path = f'{os.path.splitext(self.final_path)[0]}.{extension}'
+
+    def remux_part(self):
+        """
+        Copy the streams of the part file into a new file with its index
+        written, readers keep reading the part file meanwhile
+
+        Returns:
+            str: Remuxed file, the part file itself if ffmpeg failed
+        """
+        base, extension = os.path.splitext(self.final_path)
+        remuxed_path = f'{base}.remux{extension}'
+        command = ['ffmpeg', '-y', '-loglevel', 'error', '-i', self.part_path, '-map', '0', '-c', 'copy', remuxed_path]
+        try:
+            process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        except OSError as e:
+            process = None
+            error = str(e)
+        else:
+            error = process.stderr
+        if process is not None and process.returncode == 0 and os.path.isfile(remuxed_path):
+            return remuxed_path
+        l.log("progressive", f"Remux of {self.key} failed, keeping it as downloaded: {error}")
+        try:
+            os.remove(remuxed_path)
+        except OSError:
+            pass
+        return self.part_path
+
+    def replace_part(self):
+        source = self.remux_part() if self.remux else self.part_path
+        # On Windows the rename fails while a reader has the file open
+        for attempt in range(30):
+            try:
+                os.replace(source, self.final_path)
+            except PermissionError:
+                time.sleep(1)
+                continue
+            if source != self.part_path:
+                try:
+                    os.remove(self.part_path)
+                except OSError:
+                    # Still open by a reader on Windows, the temp cleanup
+                    # removes it later
+                    pass
+            l.log("progressive", f"Download of {self.key} finished")
+            if self.on_finished:
+                self.on_finished(self.final_path)
+            return True
+        l.log("progressive", f"Could not rename {source}")
+        return False
+
+    def wait_for(self, offset):
+        # True once the byte at offset is on disk (or the download ended)
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self.size > offset or self.finished or self.failed,
+                timeout=wait_timeout
+            )
+
+    def read(self, start, end=None):
+        """
+        Yield the bytes [start, end] (end None: until the download ends),
+        waiting for the ones that are not written yet
+        """
+        position = start
+        try:
+            source = open(self.part_path, 'rb')
+        except FileNotFoundError:
+            # Renamed in the meantime
+            source = open(self.final_path, 'rb')
+        with source:
+            source.seek(start)
+            while end is None or position <= end:
+                if not self.wait_for(position):
+                    l.log("progressive", f"Timed out waiting for {self.key}")
+                    return
+                with self.condition:
+                    available = self.size
+                if position >= available:
+                    # Finished or failed, nothing more will come
+                    return
+                limit = available if end is None else min(available, end + 1)
+                data = source.read(min(chunk_size, limit - position))
+                if not data:
+                    return
+                position += len(data)
+                yield data
+
+    def response(self, request, mimetype):
+        """
+        Flask response for a request of the file, while it is downloading
+        """
+        if self.finished:
+            mimetype = self.mimetype or mimetype
+            return send_file(self.final_path, mimetype=mimetype, conditional=True)
+
+        byte_range = request.range
+        start, stop = 0, None
+        if byte_range and byte_range.units == 'bytes' and byte_range.ranges:
+            start, stop = byte_range.ranges[0]
+
+        if start < 0:
+            # bytes=-N needs the final size
+            return Response(status=416, headers={'Content-Range': 'bytes */*'})
+
+        if not self.wait_for(start) or (self.failed and self.size <= start):
+            if self.failed:
+                return Response("Download failed.", status=502)
+            return Response(status=416, headers={'Content-Range': 'bytes */*'})
+        mimetype = self.mimetype or mimetype
+        if self.finished:
+            return send_file(self.final_path, mimetype=mimetype, conditional=True)
+
+        if start == 0 and stop is None:
+            # Whole file: send it as it grows
+            response = Response(self.read(0), mimetype=mimetype, direct_passthrough=True)
+            response.headers['Accept-Ranges'] = 'bytes'
+            return response
+
+        # Only the bytes already on disk are promised, the client asks for
+        # the next ones with another Range request
+        with self.condition:
+            available = self.size
+        end = available - 1 if stop is None else min(stop - 1, available - 1)
+        response = Response(self.read(start, end), status=206, mimetype=mimetype, direct_passthrough=True)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/*'
+        response.headers['Content-Length'] = str(end - start + 1)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return response
+
+
+def sniff_audio(head):
+    """
+    (extension, mimetype) of an audio stream from its first bytes, None if
+    the container is not recognized
+    """
+    if head[4:8] == b'ftyp':
+        return 'm4a', 'audio/mp4'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        # EBML header, what YouTube serves its opus audio in
+        return 'webm', 'audio/webm'
+    if head[:4] == b'OggS':
+        return 'ogg', 'audio/ogg'
+    return None
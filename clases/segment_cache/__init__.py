@@ -0,0 +1,8 @@
+"""
+Segment Cache Module
+Disk-backed LRU cache of proxied HLS segments with shared upstream fetches
+"""
+
+from .segment_cache import SegmentCache, segment_mimetype
+
+__all__ = ['SegmentCache', 'segment_mimetype']
@@ -0,0 +1,161 @@
+"""
+Segment Cache
+Disk cache of HLS segments served through ytdlp2STRM, bounded by a byte
+budget (least recently used segments are deleted first). Concurrent requests
+of the same segment share one fetch from the origin
+"""
+
+import os
+import re
+import threading
+import requests
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from clases.log import log as l
+from clases.metrics.metrics import Metrics
+from clases.single_flight.single_flight import SingleFlight
+
+chunk_size = 256 * 1024
+
+Metrics.shared().describe(
+    'ytdlp2strm_segment_cache_total',
+    'HLS segments served by the segment cache, by answer (hit, fetched, failed)'
+)
+Metrics.shared().describe(
+    'ytdlp2strm_segment_cache_bytes_total',
+    'Bytes of HLS segments served by the segment cache, by source (cache, origin)'
+)
+
+class SegmentCache:
+    def __init__(self, name, folder, max_bytes, timeout=10):
+        """
+        Initialize the cache
+
+        Args:
+            name (str): Plugin name, used in the log and the metrics
+            folder (str): Folder of the cached segments
+            max_bytes (int): Byte budget of the folder
+            timeout (float): Seconds to wait for the origin
+        """
+        self.name = name
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Every segment of a popular video is shared, too many to log
+        self.flights = SingleFlight(name, log_waits=False)
+        self.lock = threading.Lock()
+        # key -> size, least recently used first
+        self.entries = OrderedDict()
+        self.size = 0
+        self.load()
+
+    def load(self):
+        # Segments of previous runs, in the order they were last used
+        os.makedirs(self.folder, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.folder):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.tmp'):
+                # Left by a killed fetch
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.size += size
+        with self.lock:
+            self.evict()
+
+    def path(self, key):
+        return os.path.join(self.folder, re.sub(r'[^\w.-]', '_', key))
+
+    def get(self, key, url):
+        """
+        File of a segment, fetched from the origin if it is not cached.
+        Callers asking for the same key meanwhile wait for that fetch.
+
+        Args:
+            key (str): Segment key, stable across requests of the segment
+            url (str): Origin URL of the segment
+
+        Returns:
+            str: Path of the cached segment, None if the fetch failed
+        """
+        path = self.path(key)
+        return self.flights.do(key, lambda: self.fetch(path, url), lambda: self.cached(path))
+
+    def cached(self, path):
+        key = os.path.basename(path)
+        with self.lock:
+            size = self.entries.get(key)
+            if size is None:
+                return None
+            self.entries.move_to_end(key)
+        try:
+            # mtime keeps the order for the next run
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.forget(key)
+            return None
+        Metrics.shared().increment('ytdlp2strm_segment_cache_total', plugin=self.name, answer='hit')
+        Metrics.shared().increment('ytdlp2strm_segment_cache_bytes_total', size, plugin=self.name, source='cache')
+        return path
+
+    def fetch(self, path, url):
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        size = 0
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                with open(temp_path, 'wb') as file:
+                    for chunk in response.iter_content(chunk_size):
+                        file.write(chunk)
+                        size += len(chunk)
+            os.replace(temp_path, path)
+        except (requests.RequestException, OSError) as e:
+            l.log(self.name, f"Error fetching segment {os.path.basename(path)}: {e}")
+            Metrics.shared().increment('ytdlp2strm_segment_cache_total', plugin=self.name, answer='failed')
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            return None
+
+        with self.lock:
+            key = os.path.basename(path)
+            self.forget(key)
+            self.entries[key] = size
+            self.size += size
+            self.evict()
+        Metrics.shared().increment('ytdlp2strm_segment_cache_total', plugin=self.name, answer='fetched')
+        Metrics.shared().increment('ytdlp2strm_segment_cache_bytes_total', size, plugin=self.name, source='origin')
+        return path
+
+    def forget(self, key):
+        size = self.entries.pop(key, None)
+        if size is not None:
+            self.size -= size
+
+    def evict(self):
+        # Called with the lock held. The newest segment stays even if it is
+        # bigger than the whole budget, it is about to be served
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.folder, key))
+            except FileNotFoundError:
+                pass
+
+
+def segment_mimetype(path):
+    # MPEG-TS packets start with the 0x47 sync byte, the rest are fMP4
+    with open(path, 'rb') as file:
+        return 'video/mp2t' if file.read(1) == b'\x47' else 'video/mp4'
@@ -0,0 +1,8 @@
+"""
+Single Flight Module
+Shares one in-flight resolution between concurrent requests for the same key
+"""
+
+from .single_flight import SingleFlight
+
+__all__ = ['SingleFlight']
@@ -0,0 +1,90 @@
+"""
+Single Flight
+Coalesces concurrent calls for the same key into one execution whose result
+(or exception) is shared by every caller
+"""
+
+import threading
+from concurrent.futures import Future
+from clases.config import config as c
+from clases.log import log as l
+
+ytdlp2strm_config = c.config('./config/config.json').get_config()
+
+try:
+    default_timeout = float(ytdlp2strm_config['ytdlp2strm_resolve_timeout'])
+except:
+    default_timeout = 60
+
+class SingleFlight:
+    def __init__(self, name, timeout=None, log_waits=True):
+        """
+        Initialize a group of flights
+
+        Args:
+            name (str): Name used in the log
+            timeout (float): Seconds a caller waits for the result,
+                             ytdlp2strm_resolve_timeout by default
+            log_waits (bool): Log the callers that join a flight
+        """
+        self.name = name
+        self.timeout = default_timeout if timeout is None else timeout
+        self.log_waits = log_waits
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, function, cached=None):
+        """
+        Run function() once for all the concurrent callers of a key
+
+        Args:
+            key (str): Flight key, e.g. the video ID
+            function (callable): Work to run, without arguments
+            cached (callable): Returns the stored result of the key, or
+                               None. Checked before joining or starting a
+                               flight, a hit runs no thread
+
+        Returns:
+            The value returned by function
+
+        Raises:
+            concurrent.futures.TimeoutError: The result was not ready in
+                time. The flight keeps running and later callers of the
+                key join it.
+            Exception: Whatever function raised, raised in every caller
+        """
+        if cached is not None:
+            result = cached()
+            if result is not None:
+                return result
+        with self.lock:
+            future = self.flights.get(key)
+            if future is None and cached is not None:
+                # Stored by a flight that finished after the first check
+                result = cached()
+                if result is not None:
+                    return result
+            leader = future is None
+            if leader:
+                future = Future()
+                self.flights[key] = future
+
+        if leader:
+            # Own thread, so every caller (the first one too) can give up
+            # after the timeout
+            threading.Thread(target=self.run, args=(key, future, function), daemon=True).start()
+        elif self.log_waits:
+            l.log(self.name, f"Waiting for the in-flight resolution of {key}")
+        return future.result(timeout=self.timeout)
+
+    def run(self, key, future, function):
+        try:
+            result = function()
+        except BaseException as e:
+            with self.lock:
+                self.flights.pop(key, None)
+            future.set_exception(e)
+            return
+        with self.lock:
+            self.flights.pop(key, None)
+        future.set_result(result)
@@ -0,0 +1,8 @@
+"""
+SponsorBlock Module
+Cached skip segments used to cut sponsors out of HLS playlists
+"""
+
+from .sponsorblock import SponsorBlock
+
+__all__ = ['SponsorBlock']
@@ -0,0 +1,150 @@
+"""
+SponsorBlock
+Skip segments of a video from the SponsorBlock API, fetched once and kept
+in a persistent cache
+"""
+
+import os
+import json
+import time
+import threading
+import requests
+from clases.log import log as l
+from clases.library_index.library_index import cache_folder
+
+api_url = 'https://sponsor.ajay.app/api/skipSegments'
+
+class SponsorBlock:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cache_file, ttl=86400, timeout=5, retry_seconds=300):
+        """
+        Initialize the client
+
+        Args:
+            cache_file (str): JSON file with the segments of every video
+            ttl (int): Seconds the segments of a video are reused, new
+                       submissions show up after that
+            timeout (float): Seconds to wait for the API
+            retry_seconds (int): Seconds a failed request is remembered,
+                                 the videos play uncut meanwhile instead of
+                                 waiting for the API again
+        """
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_seconds = retry_seconds
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        # One API request per video at a time
+        self.video_locks = {}
+        self.load()
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(os.path.join(cache_folder, 'sponsorblock.json'))
+            return cls._instance
+
+    def load(self):
+        # video ID -> {'updated', 'categories', 'segments': [[start, end], ...],
+        # 'failed'}
+        self.videos = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file, 'r', encoding='utf-8') as file:
+                    self.videos = json.load(file)
+            except Exception as e:
+                l.log("sponsorblock", f"Error reading {self.cache_file}: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        temp_file = f'{self.cache_file}.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(self.videos, file)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            l.log("sponsorblock", f"Error writing {self.cache_file}: {e}")
+
+    def cached(self, video_id, categories):
+        with self.lock:
+            entry = self.videos.get(video_id)
+        if not entry or entry['categories'] != categories:
+            return None
+        ttl = self.retry_seconds if entry.get('failed') else self.ttl
+        if time.time() - entry['updated'] < ttl:
+            return entry['segments']
+        return None
+
+    def segments(self, video_id, categories):
+        """
+        Time ranges to skip
+
+        Args:
+            video_id (str): YouTube video ID
+            categories (list): SponsorBlock categories (sponsor, intro...)
+
+        Returns:
+            list: [start, end] seconds, sorted. Empty if the video has no
+                  segments or the API could not be reached
+        """
+        segments = self.cached(video_id, categories)
+        if segments is not None:
+            return segments
+
+        with self.lock:
+            video_lock = self.video_locks.setdefault(video_id, threading.Lock())
+        try:
+            with video_lock:
+                segments = self.cached(video_id, categories)
+                if segments is not None:
+                    return segments
+                segments = self.fetch(video_id, categories)
+                failed = segments is None
+                if failed:
+                    # API down, play the video uncut and ask again after
+                    # retry_seconds
+                    segments = []
+                with self.lock:
+                    self.videos[video_id] = {
+                        'updated': time.time(),
+                        'categories': categories,
+                        'segments': segments,
+                        'failed': failed
+                    }
+                    self.save()
+        finally:
+            with self.lock:
+                self.video_locks.pop(video_id, None)
+        return segments
+
+    def fetch(self, video_id, categories):
+        try:
+            response = self.session.get(
+                api_url,
+                params={'videoID': video_id, 'categories': json.dumps(categories)},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            l.log("sponsorblock", f"Error getting segments of {video_id}: {e}")
+            return None
+        if response.status_code == 404:
+            # No segments submitted
+            return []
+        if response.status_code != 200:
+            l.log("sponsorblock", f"Error getting segments of {video_id}: HTTP {response.status_code}")
+            return None
+        try:
+            segments = sorted(
+                [float(item['segment'][0]), float(item['segment'][1])]
+                for item in response.json()
+                if item.get('actionType', 'skip') == 'skip'
+            )
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            l.log("sponsorblock", f"Invalid segments of {video_id}: {e}")
+            return None
+        l.log("sponsorblock", f"{len(segments)} segments to skip in {video_id}")
+        return segments
@@ -0,0 +1,8 @@
+"""
+Stream Buffer Module
+Prebuffered, bounded streaming of process output for the bridge modes
+"""
+
+from .stream_buffer import StreamBuffer
+
+__all__ = ['StreamBuffer']
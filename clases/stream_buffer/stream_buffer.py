@@ -0,0 +1,133 @@
+"""
+Stream Buffer
+Bounded buffer between a yt-dlp/ffmpeg process writing to stdout and the HTTP
+response of the bridge modes
+"""
+
+import time
+import threading
+from queue import Queue, Empty, Full
+from clases.config import config as c
+
+ytdlp2strm_config = c.config('./config/config.json').get_config()
+
+def config_int(key, default):
+    try:
+        return int(ytdlp2strm_config[key])
+    except:
+        return default
+
+# Bytes read from the process at once
+chunk_size = config_int('ytdlp2strm_bridge_chunk_size', 64 * 1024)
+# Chunks held in memory, when full the process is no longer read and blocks
+# on its stdout
+max_chunks = config_int('ytdlp2strm_bridge_buffer_chunks', 256)
+# The first bytes are sent once this many are buffered...
+prebuffer_bytes = config_int('ytdlp2strm_bridge_prebuffer_bytes', 512 * 1024)
+# ...or this many seconds passed, whatever comes first
+try:
+    prebuffer_seconds = float(ytdlp2strm_config['ytdlp2strm_bridge_prebuffer_seconds'])
+except:
+    prebuffer_seconds = 2.0
+
+EOF_MARK = None
+
+class StreamBuffer:
+    def __init__(self, process, chunk_size=chunk_size, max_chunks=max_chunks,
+                 prebuffer_bytes=prebuffer_bytes, prebuffer_seconds=prebuffer_seconds):
+        """
+        Initialize the buffer of a process
+
+        Args:
+            process (subprocess.Popen): Process started with stdout=PIPE
+            chunk_size (int): Bytes read from stdout at once
+            max_chunks (int): Chunks buffered before the process is paused
+            prebuffer_bytes (int): Bytes gathered before the first write
+            prebuffer_seconds (float): Max seconds to wait for them
+        """
+        self.process = process
+        self.chunk_size = max(1, chunk_size)
+        self.prebuffer_bytes = prebuffer_bytes
+        self.prebuffer_seconds = prebuffer_seconds
+        self.queue = Queue(maxsize=max(1, max_chunks))
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+
+    def put(self, item):
+        # Blocks while the buffer is full (backpressure), gives up on close
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read(self):
+        stdout = self.process.stdout
+        # read1 returns what is available instead of waiting for a full chunk
+        read = getattr(stdout, 'read1', stdout.read)
+        try:
+            while not self.stop.is_set():
+                chunk = read(self.chunk_size)
+                if not chunk or not self.put(chunk):
+                    break
+        except (OSError, ValueError):
+            # stdout closed by close()
+            pass
+        finally:
+            self.put(EOF_MARK)
+
+    def generate(self):
+        """
+        Yield the process output: one block once the prebuffer is filled,
+        then every chunk as it is read. The process is killed when the
+        generator is closed (client disconnected) or the output ends.
+        """
+        self.thread.start()
+        try:
+            pending = []
+            size = 0
+            finished = False
+            deadline = time.monotonic() + self.prebuffer_seconds
+            while size < self.prebuffer_bytes:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    chunk = self.queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if chunk is EOF_MARK:
+                    finished = True
+                    break
+                pending.append(chunk)
+                size += len(chunk)
+            if pending:
+                yield b''.join(pending)
+            pending = None
+
+            while not finished:
+                chunk = self.queue.get()
+                if chunk is EOF_MARK:
+                    break
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self.stop.set()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        # Free the memory right away and unblock the reader
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Empty:
+                break
+        try:
+            self.process.stdout.close()
+        except Exception:
+            pass
+        self.thread.join(timeout=1)
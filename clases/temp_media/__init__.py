@@ -0,0 +1,8 @@
+"""
+Temp Media Module
+ID-based naming and manifest of the media files in the temp folder
+"""
+
+from .temp_media import TempMedia
+
+__all__ = ['TempMedia']
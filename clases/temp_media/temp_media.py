@@ -0,0 +1,151 @@
+"""
+Temp Media
+Deterministic paths for the media downloaded to the temp folder and a
+manifest of the finished files, keyed by (plugin, ID, variant)
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from clases.log import log as l
+from clases.library_index.library_index import cache_folder
+
+temp_folder = os.path.abspath('./temp')
+
+class TempMedia:
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, manifest_file):
+        """
+        Initialize the manifest
+
+        Args:
+            manifest_file (str): JSON file with the finished temp files,
+                                 shared by every ytdlp2STRM process
+        """
+        self.manifest_file = manifest_file
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.manifest_mtime = None
+
+    @classmethod
+    def shared(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(os.path.join(cache_folder, 'temp_media.json'))
+            return cls._instance
+
+    def reload(self):
+        # Only read the manifest again if another process wrote it
+        try:
+            mtime = os.stat(self.manifest_file).st_mtime_ns
+        except FileNotFoundError:
+            self.entries = {}
+            self.manifest_mtime = None
+            return
+        if mtime == self.manifest_mtime:
+            return
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except Exception as e:
+            l.log("temp_media", f"Error reading {self.manifest_file}: {e}")
+            self.entries = {}
+        self.manifest_mtime = mtime
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+        temp_file = f'{self.manifest_file}.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(self.entries, file)
+            os.replace(temp_file, self.manifest_file)
+            self.manifest_mtime = os.stat(self.manifest_file).st_mtime_ns
+        except Exception as e:
+            l.log("temp_media", f"Error writing {self.manifest_file}: {e}")
+
+    def path(self, plugin, media_id, variant, extension=None):
+        """
+        Path of a temp file, the same for the same (plugin, ID, variant)
+
+        Args:
+            plugin (str): Plugin name
+            media_id (str): Video ID
+            variant (str): Kind of file (video, audio...)
+            extension (str): Extension without the dot, None for the base
+                             path of tools that add their own
+
+        Returns:
+            str: Absolute path inside the temp folder
+        """
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', media_id)
+        name = f'{plugin}.{safe_id}.{variant}'
+        if extension:
+            name = f'{name}.{extension}'
+        return os.path.join(temp_folder, name)
+
+    def lookup(self, plugin, media_id, variant, extensions=()):
+        """
+        Finished file of (plugin, ID, variant)
+
+        Args:
+            extensions (tuple): Extensions to look for next to the base
+                                path when the manifest has no entry (a file
+                                finished by a process that could not record it)
+
+        Returns:
+            str: Path of the file, None if it is not downloaded
+        """
+        key = f'{plugin}/{media_id}/{variant}'
+        with self.lock:
+            self.reload()
+            entry = self.entries.get(key)
+        if entry:
+            if os.path.isfile(entry['file']):
+                return entry['file']
+            self.forget(entry['file'])
+        base = self.path(plugin, media_id, variant)
+        for extension in extensions:
+            file = f'{base}.{extension}'
+            if os.path.isfile(file):
+                self.record(plugin, media_id, variant, file)
+                return file
+        return None
+
+    def record(self, plugin, media_id, variant, file):
+        """
+        Add a finished file to the manifest
+        """
+        key = f'{plugin}/{media_id}/{variant}'
+        with self.lock:
+            self.reload()
+            self.entries[key] = {
+                'file': os.path.abspath(file),
+                'size': os.path.getsize(file),
+                'created': time.time()
+            }
+            self.save()
+
+    def forget(self, file):
+        """
+        Remove a file from the manifest (deleted by the temp cleanup)
+        """
+        file = os.path.abspath(file)
+        with self.lock:
+            self.reload()
+            keys = [key for key, entry in self.entries.items() if entry['file'] == file]
+            for key in keys:
+                del self.entries[key]
+            if keys:
+                self.save()
+
+    def files(self):
+        """
+        Paths of every finished media file of the manifest
+        """
+        with self.lock:
+            self.reload()
+            return {entry['file'] for entry in self.entries.values()}
@@ -0,0 +1,8 @@
+"""
+Upstream STRM Module
+STRM files that point straight to the upstream URL, refreshed before expiry
+"""
+
+from .upstream_strm import UpstreamStrm, registered_ids
+
+__all__ = ['UpstreamStrm', 'registered_ids']
@@ -0,0 +1,234 @@
+"""
+Upstream STRM
+Keeps the resolved upstream URL inside the STRM files of the most recently
+played or added videos, rewriting them before the URL expires, so their
+playback does not go through the ytdlp2STRM server. Media servers read a STRM
+when they scan or refresh its item, every rewrite asks them to refresh it
+"""
+
+import os
+import json
+import time
+import threading
+from clases.log import log as l
+from clases.prewarm.prewarm import Prewarmer
+from clases.library_index.library_index import cache_folder
+
+class UpstreamStrm:
+    def __init__(self, name, media_folder, pattern, resolve, server_content,
+                 hot_items=50, margin=1800, workers=2, interval=300, on_rewrite=None):
+        """
+        Initialize the refresher of a plugin
+
+        Args:
+            name (str): Plugin name, used for the log and the registry file
+            media_folder (str): strm_output_folder of the plugin
+            pattern (re.Pattern): Matches the server URL of a STRM, group 1
+                                  is the video ID
+            resolve (callable): video ID -> (STRM content, expire epoch),
+                                None if it could not be resolved
+            server_content (callable): video ID -> server URL of the STRM
+            hot_items (int): STRMs kept with an upstream URL
+            margin (int): Seconds before the expiry a STRM is rewritten
+            workers (int): Videos resolved at the same time
+            interval (int): Seconds between two passes over the library
+            on_rewrite (callable): Called with the list of rewritten STRM
+                                   paths, so the media server refreshes them
+        """
+        self.name = name
+        self.media_folder = media_folder
+        self.pattern = pattern
+        self.resolve = resolve
+        self.server_content = server_content
+        self.hot_items = hot_items
+        self.margin = margin
+        self.interval = interval
+        self.on_rewrite = on_rewrite
+        self.registry_file = os.path.join(cache_folder, name, 'upstream_strm.json')
+        self.lock = threading.Lock()
+        # Playback requests pause the refresh, see live()
+        self.refresher = Prewarmer(name, self.refresh, workers, pause=0.5)
+        self.thread = None
+        self.load()
+
+    def load(self):
+        # strm path -> {'id', 'added', 'played', 'expire'}, expire 0 for
+        # server URLs
+        self.entries = {}
+        if os.path.exists(self.registry_file):
+            try:
+                with open(self.registry_file, 'r', encoding='utf-8') as file:
+                    self.entries = json.load(file)
+            except Exception as e:
+                l.log(self.name, f"Error reading {self.registry_file}: {e}")
+
+    def save(self):
+        with self.lock:
+            entries = dict(self.entries)
+        os.makedirs(os.path.dirname(self.registry_file), exist_ok=True)
+        temp_file = f'{self.registry_file}.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as file:
+                json.dump(entries, file)
+            os.replace(temp_file, self.registry_file)
+        except Exception as e:
+            l.log(self.name, f"Error writing {self.registry_file}: {e}")
+
+    def start(self):
+        """Start the background passes (web server process only)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name=f'{self.name}-upstream-strm', daemon=True)
+            self.thread.start()
+            l.log(self.name, f"Upstream STRM refresher started ({self.hot_items} items)")
+
+    def live(self):
+        return self.refresher.live()
+
+    def run(self):
+        while True:
+            try:
+                self.cycle()
+            except Exception as e:
+                l.log(self.name, f"Error refreshing upstream STRMs: {e}")
+            time.sleep(self.interval)
+
+    def discover(self):
+        # New STRMs are written with the server URL by the scans, the ID is
+        # read from it once
+        found = set()
+        for root, dirs, files in os.walk(self.media_folder):
+            for file in files:
+                if not file.endswith('.strm'):
+                    continue
+                path = os.path.join(root, file)
+                found.add(path)
+                if path in self.entries:
+                    continue
+                match = self.pattern.search(read_strm(path) or '')
+                if match:
+                    with self.lock:
+                        self.entries[path] = {
+                            'id': match.group(1),
+                            'added': os.path.getmtime(path),
+                            'played': 0,
+                            'expire': 0
+                        }
+        with self.lock:
+            for path in [path for path in self.entries if path not in found]:
+                del self.entries[path]
+
+    def played(self, video_id):
+        """
+        Record a play of a video seen by the server (its STRM still had the
+        server URL, or its manifest file was requested). The access time of
+        the STRM is no use, media servers read it on every refresh too
+        """
+        now = time.time()
+        with self.lock:
+            for entry in self.entries.values():
+                if entry['id'] == video_id:
+                    entry['played'] = now
+
+    def priority(self, path, entry):
+        # Last play or when it was added
+        return max(entry.get('played', 0), entry['added'])
+
+    def cycle(self):
+        self.discover()
+        with self.lock:
+            entries = list(self.entries.items())
+        entries.sort(key=lambda item: self.priority(*item), reverse=True)
+        now = time.time()
+
+        due = []
+        rewritten = []
+        for rank, (path, entry) in enumerate(entries):
+            if rank < self.hot_items:
+                if entry['expire'] - self.margin < now:
+                    due.append(path)
+            elif entry['expire']:
+                # Not hot anymore, back to the server URL before it expires
+                if self.write(path, self.server_content(entry['id']), 0):
+                    rewritten.append(path)
+        if due:
+            self.refresher.submit(due)
+        self.save()
+        self.notify(rewritten)
+
+    def refresh(self, path):
+        with self.lock:
+            entry = self.entries.get(path)
+        if not entry:
+            return
+        result = self.resolve(entry['id'])
+        written = False
+        if result:
+            content, expire = result
+            written = self.write(path, content, expire)
+        elif entry['expire']:
+            written = self.write(path, self.server_content(entry['id']), 0)
+        self.save()
+        if written:
+            self.notify([path])
+
+    def revert(self):
+        """
+        Write the server URL back to every STRM holding an upstream URL and
+        forget them all, for when strm_content is back to server
+        """
+        with self.lock:
+            entries = list(self.entries.items())
+        rewritten = [
+            path for path, entry in entries
+            if entry['expire'] and self.write(path, self.server_content(entry['id']), 0)
+        ]
+        with self.lock:
+            self.entries = {}
+        try:
+            os.remove(self.registry_file)
+        except FileNotFoundError:
+            pass
+        if rewritten:
+            l.log(self.name, f"{len(rewritten)} upstream STRMs back to the server URL")
+        self.notify(rewritten)
+
+    def notify(self, paths):
+        if paths and self.on_rewrite:
+            try:
+                self.on_rewrite(paths)
+            except Exception as e:
+                l.log(self.name, f"Error notifying rewritten STRMs: {e}")
+
+    def write(self, path, content, expire):
+        # In place, so the folder mtime (library index signature) doesn't
+        # change
+        try:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(content)
+        except OSError as e:
+            l.log(self.name, f"Error writing {path}: {e}")
+            return False
+        with self.lock:
+            if path in self.entries:
+                self.entries[path]['expire'] = expire
+        return True
+
+
+def read_strm(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def registered_ids(plugin):
+    """
+    strm path -> video ID of the STRMs a refresher manages, their upstream
+    URLs don't contain the ID
+    """
+    registry_file = os.path.join(cache_folder, plugin, 'upstream_strm.json')
+    try:
+        with open(registry_file, 'r', encoding='utf-8') as file:
+            return {os.path.normpath(path): entry['id'] for path, entry in json.load(file).items()}
+    except (OSError, ValueError):
+        return {}
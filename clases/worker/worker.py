@@ -4,11 +4,19 @@ import shlex
 import requests
 import time
 import threading
+from queue import Queue, Full
 from clases.log import log as l
+from clases.ytdlp_engine import ytdlp_engine as e
+from clases.temp_media.temp_media import TempMedia
+from clases.cookie_jar.cookie_jar import check_auth_error, remove_copies
+from clases.stream_buffer.stream_buffer import StreamBuffer
 
 # Inicializa un objeto Lock para el control de concurrencia
 preload_lock = threading.Lock()
 
+# Lines of an in-process command waiting for the consumer of lines()
+lines_queue_size = 64
+
 # Variable de cierre para controlar la ejecución concurrente de la función preload_video
 is_preloading = False
 
@@ -19,16 +27,116 @@ class worker:
         self.wd =  os.path.abspath('.')
 
     def output(self):
-        process = subprocess.run(
-            self.command,  # Unimos el comando en una cadena de texto
-            #shell=True,
-            capture_output=True,  # Capturamos stdout y stderr
+        try:
+            if e.enabled(self.command):
+                # yt-dlp Python API, no new interpreter for each call
+                stdout, stderr = e.run(self.command)
+            else:
+                process = subprocess.run(
+                    e.add_cache_dir(self.command),  # Unimos el comando en una cadena de texto
+                    #shell=True,
+                    capture_output=True,  # Capturamos stdout y stderr
+                    text=True
+                )
+                stdout, stderr = process.stdout, process.stderr
+        finally:
+            remove_copies(self.command)
+        self.log_stderr(stderr)
+        return stdout
+
+    def lines(self):
+        """
+        Yield the stdout lines of the command as soon as they are printed,
+        instead of waiting for the command to exit like output()
+        """
+        if e.enabled(self.command):
+            # Bounded, the extraction waits for the consumer and stops when
+            # the consumer stops reading
+            queue = Queue(maxsize=lines_queue_size)
+            stop = threading.Event()
+            result = {}
+
+            def put(message):
+                while not stop.is_set():
+                    try:
+                        queue.put(message, timeout=0.5)
+                        return
+                    except Full:
+                        continue
+
+            def target():
+                try:
+                    result['stderr'] = e.stream(self.command, put, stop)
+                finally:
+                    put(None)
+
+            threading.Thread(target=target, daemon=True).start()
+            finished = False
+            try:
+                while True:
+                    message = queue.get()
+                    if message is None:
+                        break
+                    yield from message.splitlines()
+                finished = True
+            finally:
+                stop.set()
+                remove_copies(self.command)
+            if finished:
+                self.log_stderr(result.get('stderr'))
+            return
+
+        process = subprocess.Popen(
+            e.add_cache_dir(self.command),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True
         )
-        if process.stderr:
-            if not 'The channel is not currently live' in process.stderr and not '[twitch:stream] videos: videos does not exist' in process.stderr:
-                l.log("worker", process.stderr)
-        return process.stdout
+        # stderr is drained aside so a chatty command can't block on it
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+        reader.start()
+        finished = False
+        try:
+            for line in process.stdout:
+                yield line.rstrip('\n')
+            finished = True
+        finally:
+            if not finished:
+                # The consumer stopped early
+                process.kill()
+            process.wait()
+            reader.join()
+            remove_copies(self.command)
+        self.log_stderr(''.join(stderr))
+
+    def pipe(self):
+        """
+        Start the command with its stdout as a pipe, with the same yt-dlp
+        setup (cache dir) as the other calls. The caller removes the
+        cookies copies once the process exits
+        """
+        return subprocess.Popen(
+            e.add_cache_dir(self.command),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+
+    def buffered(self):
+        """
+        Yield the stdout of the command through a bounded prebuffer (bridge
+        modes), the process is killed as soon as the client goes away
+        """
+        try:
+            yield from StreamBuffer(self.pipe()).generate()
+        finally:
+            remove_copies(self.command)
+
+    def log_stderr(self, stderr):
+        check_auth_error(stderr)
+        if stderr:
+            if not 'The channel is not currently live' in stderr and not '[twitch:stream] videos: videos does not exist' in stderr:
+                l.log("worker", stderr)
     
     def shell(self):
         process = subprocess.run(
@@ -43,9 +151,12 @@ class worker:
 
     
     def call(self):
-        return subprocess.call(
-            self.command
-        )
+        try:
+            return subprocess.call(
+                e.add_cache_dir(self.command)
+            )
+        finally:
+            remove_copies(self.command)
 
 
     def run(self):
@@ -78,11 +189,6 @@ class worker:
     def preload(self):
         global is_preloading
 
-        current_dir = os.getcwd()
-
-        # Construyes la ruta hacia la carpeta 'temp' dentro del directorio actual
-        temp_dir = os.path.join(current_dir, 'temp')
-
         # Intenta adquirir el Lock
         if not preload_lock.acquire(blocking=False):
             # Si no se puede adquirir el Lock, significa que otra instancia ya está ejecutando preload_video
@@ -103,16 +209,9 @@ class worker:
                 log_text = ("error on preloading {}".format(self.command))
                 l.log("worker", log_text)
 
-        video_id = self.command.split('_')[-1]
-
-        isin = False
-        # Iterar sobre todos los archivos en la carpeta 'temp'
-        for filename in os.listdir(temp_dir):
-            # Comprobar si el crunchroll_id está en el nombre del archivo
-            if video_id in filename:
-                isin = True
-                # Si necesitas hacer algo más que imprimir, este es el lugar.
-                # Por ejemplo, podrías romper el bucle con 'break' si solo te interesa saber si al menos uno existe
+        # STRM URL: http://host:port/crunchyroll/<mode>/<series_id>_<episode_id>
+        crunchyroll_id = self.command.strip().rstrip('/').split('/')[-1]
+        isin = TempMedia.shared().lookup('crunchyroll', crunchyroll_id, 'video', ('mkv', 'mp4')) is not None
 
         if not isin:
             preload_thread = threading.Thread(target=download_and_cancel)
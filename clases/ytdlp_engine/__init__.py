@@ -0,0 +1,8 @@
+"""
+yt-dlp Engine Module
+Subprocess, in-process and isolated worker process execution of yt-dlp commands
+"""
+
+from .ytdlp_engine import run, run_inprocess, stream, enabled
+
+__all__ = ['run', 'run_inprocess', 'stream', 'enabled']
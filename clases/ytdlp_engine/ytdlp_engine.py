@@ -0,0 +1,239 @@
+"""
+yt-dlp Engine
+Runs yt-dlp command lines through the yt-dlp Python API instead of spawning a
+new yt-dlp interpreter for every call
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from clases.config import config as c
+from clases.cookie_jar.cookie_jar import copy_source
+
+ytdlp2strm_config = c.config('./config/config.json').get_config()
+
+# subprocess : one yt-dlp process per call (default)
+# inprocess  : yt-dlp Python API inside the ytdlp2STRM process
+# isolated   : yt-dlp Python API inside long-lived worker processes, a crashing
+#              extractor only takes down its worker
+engine = str(ytdlp2strm_config.get('ytdlp2strm_ytdlp_engine', 'subprocess')).lower()
+cache_dir = os.path.abspath(ytdlp2strm_config.get('ytdlp2strm_ytdlp_cache_dir', './cache/yt-dlp'))
+try:
+    workers = max(1, int(ytdlp2strm_config['ytdlp2strm_ytdlp_workers']))
+except:
+    workers = 2
+
+# Idle YoutubeDL instances ready to be reused, by command options
+max_idle_per_options = 4
+max_options = 16
+idle = OrderedDict()
+idle_lock = threading.Lock()
+
+executor = None
+executor_lock = threading.Lock()
+
+
+class CaptureLogger:
+    """
+    yt-dlp logger. Screen messages ([youtube] Downloading webpage...) are
+    dropped, warnings and errors are kept as the stderr of the call
+    """
+    def __init__(self):
+        self.stderr = []
+
+    def debug(self, msg):
+        pass
+
+    def info(self, msg):
+        pass
+
+    def warning(self, msg):
+        self.stderr.append(msg)
+
+    def error(self, msg):
+        self.stderr.append(msg)
+
+
+def youtube_dl_class():
+    import yt_dlp
+
+    class CapturingYoutubeDL(yt_dlp.YoutubeDL):
+        # --dump-json, --print, --get-url... write through to_stdout
+        def to_stdout(self, message, skip_eol=False, quiet=None):
+            if self.stop is not None and self.stop.is_set():
+                # The reader went away, stop extracting
+                raise yt_dlp.utils.DownloadCancelled('Output no longer read')
+            if self.on_stdout:
+                self.on_stdout(message)
+            else:
+                self.stdout.append(message)
+
+    return CapturingYoutubeDL
+
+
+def new_instance(ydl_opts):
+    ydl = youtube_dl_class()(ydl_opts)
+    if ydl.params.get('cookiefile'):
+        # The cookies copy of the call is read now and deleted when the call
+        # returns (remove_copies), close() must not write it back
+        try:
+            ydl.cookiejar
+        except Exception:
+            # Left as is, the call reports the error
+            return ydl
+        ydl.params['cookiefile'] = None
+    return ydl
+
+
+def checkout(key, ydl_opts):
+    with idle_lock:
+        instances = idle.get(key)
+        if instances:
+            idle.move_to_end(key)
+            return instances.pop()
+    return new_instance(ydl_opts)
+
+
+def checkin(key, ydl):
+    with idle_lock:
+        instances = idle.setdefault(key, [])
+        idle.move_to_end(key)
+        if len(instances) < max_idle_per_options:
+            instances.append(ydl)
+        while len(idle) > max_options:
+            idle.popitem(last=False)
+
+
+def run_inprocess(command, on_stdout=None, stop=None):
+    """
+    Run a yt-dlp command line with the Python API
+
+    Args:
+        command (list): yt-dlp command line, command[0] is 'yt-dlp'
+        on_stdout (callable): Called with every stdout line as soon as it
+                              is printed, instead of returning them
+        stop (threading.Event): Set to cancel the run at the next line
+
+    Returns:
+        tuple: (stdout, stderr) as the yt-dlp executable would print them
+    """
+    import yt_dlp
+
+    try:
+        parsed = yt_dlp.parse_options(command[1:])
+    except SystemExit:
+        return '', f'ERROR: invalid yt-dlp options {command[1:]}'
+
+    urls = parsed.urls
+    ydl_opts = parsed.ydl_opts
+    if ydl_opts.get('cachedir') is None:
+        ydl_opts['cachedir'] = cache_dir
+    logger = CaptureLogger()
+    ydl_opts['logger'] = logger
+
+    # The download archive is read when YoutubeDL is created, so instances
+    # that use one are never reused. Each call gets its own cookies copy,
+    # instances are shared by the copies of the same export
+    key = tuple(copy_source(argument) for argument in command if argument not in urls)
+    reusable = not ydl_opts.get('download_archive')
+    ydl = checkout(key, ydl_opts) if reusable else new_instance(ydl_opts)
+    ydl.params['logger'] = logger
+    ydl.stdout = []
+    ydl.on_stdout = on_stdout
+    ydl.stop = stop
+
+    try:
+        ydl.download(urls)
+    except yt_dlp.utils.DownloadCancelled:
+        pass
+    except Exception as e:
+        if not logger.stderr:
+            logger.stderr.append(f'ERROR: {e}')
+        reusable = False
+
+    stdout = '\n'.join(ydl.stdout)
+    if stdout:
+        stdout += '\n'
+    ydl.stdout = []
+    ydl.on_stdout = None
+    ydl.stop = None
+    if reusable:
+        checkin(key, ydl)
+    else:
+        ydl.close()
+    return stdout, '\n'.join(logger.stderr)
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return executor
+
+
+def run_isolated(command):
+    global executor
+    pool = get_executor()
+    try:
+        return pool.submit(run_inprocess, command).result()
+    except BrokenProcessPool:
+        # A worker died (crash in an extractor), start a fresh pool for the
+        # next calls
+        with executor_lock:
+            if executor is pool:
+                executor = None
+        pool.shutdown(wait=False)
+        return '', 'ERROR: yt-dlp worker process crashed'
+
+
+def add_cache_dir(command):
+    # Keep the signature/nsig cache in a persistent folder (also in Docker)
+    if command and command[0] == 'yt-dlp' and '--cache-dir' not in command and '--no-cache-dir' not in command:
+        return command + ['--cache-dir', cache_dir]
+    return command
+
+
+def run(command):
+    """
+    Run a yt-dlp command line with the configured engine
+
+    Args:
+        command (list): yt-dlp command line
+
+    Returns:
+        tuple: (stdout, stderr)
+    """
+    command = add_cache_dir(command)
+    if engine == 'isolated':
+        return run_isolated(command)
+    return run_inprocess(command)
+
+
+def stream(command, on_stdout, stop=None):
+    """
+    Run a yt-dlp command line with the configured engine, passing each
+    stdout line to on_stdout as it is printed. Setting stop cancels the run
+    at the next line (the isolated engine runs to the end)
+
+    Returns:
+        str: stderr
+    """
+    command = add_cache_dir(command)
+    if engine == 'isolated':
+        # Worker processes can only hand back the whole output
+        stdout, stderr = run_isolated(command)
+        for line in stdout.splitlines():
+            on_stdout(line)
+        return stderr
+    return run_inprocess(command, on_stdout, stop)[1]
+
+
+def enabled(command):
+    return engine in ('inprocess', 'isolated') and bool(command) and command[0] == 'yt-dlp'
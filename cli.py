@@ -3,6 +3,7 @@ import argparse
 import config.plugins as plugins
 from clases.log import log as l
 from utils.sanitize import sanitize
+from clases.channel_cache.channel_cache import ChannelCache
 
 def main(raw_args=None):
     parser=argparse.ArgumentParser()
@@ -10,6 +11,7 @@ def main(raw_args=None):
     parser.add_argument('-m', '--media', help='Media platform')
     parser.add_argument('-p', '--params', help='Params to media platform mode.')
     parser.add_argument('-v', '--version', help='Show YTDLP2STRM version')
+    parser.add_argument('--refresh-metadata', action='store_true', help='Fetch channel metadata again ignoring the cache')
     # Keep working for old version
     parser.add_argument('--m', help='Media platform (old)')
     parser.add_argument('--p', help='Params to media platform mode (old)')
@@ -59,6 +61,9 @@ def main(raw_args=None):
         )
         l.log("CLI", log_text)
 
+    if args.refresh_metadata and method:
+        ChannelCache.for_plugin(method).clear()
+
     r = False
     if params != None:
         r = eval("{}.{}.{}".format("plugins",method,"to_strm"))(*params)
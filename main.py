@@ -10,6 +10,7 @@ from clases.config import config as c
 from clases.folders import folders as f
 from clases.log import log as l
 from clases.cron import cron as cron
+from clases.cookie_jar import cookie_jar
 
 # Variables globales para controlar el reinicio y parada
 restart_flag = False
@@ -78,6 +79,14 @@ if __name__ == "__main__":
     log_text = (" * Clean old videos thread started")
     l.log("main", log_text)
 
+    # Hilo que renueva la copia de las cookies del navegador
+    if cookie_jar.refresh_interval > 0:
+        thread_refresh_cookies = Thread(target=cookie_jar.refresh_cookies, args=(stop_event,))
+        thread_refresh_cookies.daemon = True
+        thread_refresh_cookies.start()
+        log_text = (" * Refresh cookies thread started")
+        l.log("main", log_text)
+
     # Crear un proceso para la aplicación Flask
     port = ytdlp2strm_config['ytdlp2strm_port']
     flask_thread = Thread(target=run_flask_app, args=(stop_event, port))
@@ -9,6 +9,7 @@ from clases.worker import worker as w
 from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
+from clases.temp_media.temp_media import TempMedia
 from plugins.crunchyroll.jellyfin import daemon
 import subprocess
 import threading
@@ -557,11 +558,8 @@ def download(crunchyroll_id, return_file=True):
         return None
     
     # Buscar archivo ya descargado
-    existing_file = None
-    for filename in os.listdir(temp_dir):
-        if crunchyroll_id in filename and (filename.endswith('.mp4') or filename.endswith('.mkv')):
-            existing_file = os.path.join(temp_dir, filename)
-            break
+    temp_media = TempMedia.shared()
+    existing_file = temp_media.lookup('crunchyroll', crunchyroll_id, 'video', ('mkv', 'mp4'))
     
     if not existing_file:
         l.log("crunchyroll", f"Downloading episode: {episode_id} from series: {series_id}")
@@ -580,7 +578,8 @@ def download(crunchyroll_id, return_file=True):
         
         # Comando de descarga usando multi-downloader-nx
         # Usar ruta absoluta en fileName para forzar descarga en temp_dir
-        output_path = os.path.join(temp_dir, crunchyroll_id)
+        output_path = temp_media.path('crunchyroll', crunchyroll_id, 'video')
+        os.makedirs(temp_dir, exist_ok=True)
         
         command = [
             'node', multi_downloader_path,
@@ -631,11 +630,8 @@ def download(crunchyroll_id, return_file=True):
                 abort(500)
             return None
         
-        # Buscar el archivo descargado
-        for filename in os.listdir(temp_dir):
-            if crunchyroll_id in filename and (filename.endswith('.mp4') or filename.endswith('.mkv')):
-                existing_file = os.path.join(temp_dir, filename)
-                break
+        # Buscar el archivo descargado (multi-downloader-nx añade la extensión)
+        existing_file = temp_media.lookup('crunchyroll', crunchyroll_id, 'video', ('mkv', 'mp4'))
         
         if not existing_file:
             l.log("crunchyroll", "Downloaded file not found")
@@ -645,7 +641,7 @@ def download(crunchyroll_id, return_file=True):
     
     if return_file:
         l.log("crunchyroll", f"Serving file: {existing_file}")
-        return send_file(existing_file)
+        return send_file(existing_file, conditional=True)
     else:
         l.log("crunchyroll", f"File ready: {existing_file}")
         return existing_file
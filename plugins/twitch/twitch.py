@@ -1,10 +1,12 @@
-from flask import stream_with_context, Response, send_file, redirect
+from flask import stream_with_context, Response, send_file, redirect, request
 from utils.sanitize import sanitize
 import os
 import requests
 import re
 from utils.episode_numbering import format_episode_title
 import time
+import subprocess
+import concurrent.futures
 import sys
 from datetime import datetime
 from cachetools import TTLCache
@@ -14,6 +16,12 @@ from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
 from clases.jellyfin_notifier.jellyfin_notifier import JellyfinNotifier
+from clases.library_index.library_index import LibraryIndex
+from clases.channel_cache.channel_cache import ChannelCache
+from clases.artwork.artwork import ArtworkDownloader
+from clases.single_flight.single_flight import SingleFlight
+from clases.cookie_jar.cookie_jar import cookie_args
+from clases.probe.probe import light_response, count
 
 
 ## -- TWITCH CLASS
@@ -21,15 +29,26 @@ class Twitch:
     def __init__(self, channel):
         self.channel = channel
         self.twitch_channel_url = "https://www.twitch.tv/{}".format(channel)
-        self.channel_name = self.get_name()
-        self.images = self.get_thumbs()
+        self.metadata_changed = False
+        self.get_channel_metadata()
         self.direct = self.get_direct()
         self.videos = self.get_videos()
     
+    def get_channel_metadata(self):
+        # Name and artwork rarely change, reuse them for channel_metadata_ttl
+        channel_cache = ChannelCache.for_plugin(source_platform)
+        metadata = channel_cache.get(self.twitch_channel_url, channel_metadata_ttl)
+        if metadata is None:
+            metadata = {
+                "name" : self.get_name(),
+                "images" : self.get_thumbs()
+            }
+            self.metadata_changed = channel_cache.set(self.twitch_channel_url, metadata)
+        self.channel_name = metadata['name']
+        self.images = metadata['images']
+
     def set_cookies(self, command):
-        if cookies and cookie_value and cookies.strip() and cookie_value.strip():
-            command.append(f'--{cookies}')
-            command.append(cookie_value)
+        command.extend(cookie_args(cookies, cookie_value))
 
     def get_name(self):
         l.log("twitch", f"Getting name for channel: {self.channel}")
@@ -196,9 +215,11 @@ class Twitch:
 
     def get_videos(self):
         l.log("twitch", f"Getting videos for channel")
+        # Stream details go last, read from the end of the line (titles and
+        # descriptions may contain ;)
         command = [
             'yt-dlp', 
-            '--print', '"%(id)s;%(title)s;%(description)s;%(thumbnail)s;%(upload_date)s"', 
+            '--print', '"%(id)s;%(title)s;%(description)s;%(thumbnail)s;%(upload_date)s;%(duration)s;%(width)s;%(height)s;%(vcodec)s;%(acodec)s"', 
             '--dateafter', "today-{}days".format(days_after),
             '--playlist-start', '1', 
             '--playlist-end', videos_limit, 
@@ -258,27 +279,24 @@ try:
 except:
     episode_format = 'sequential'
 
+try:
+    channel_metadata_ttl = int(config["channel_metadata_ttl"])
+except:
+    channel_metadata_ttl = 86400
+
 # Función helper para agregar cookies a comandos
 def set_cookies_to_command(command):
-    if cookies and cookie_value and cookies.strip() and cookie_value.strip():
-        command.append(f'--{cookies}')
-        command.append(cookie_value)
+    command.extend(cookie_args(cookies, cookie_value))
 
 ## -- END
 
 
-def video_id_exists_in_content(media_folder, video_id):
-    for root, dirs, files in os.walk(media_folder):
-        for file in files:
-            if file.endswith(".strm"):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r') as f:
-                    if video_id in f.read():
-                        return True
-    return False
-
 ## -- MANDATORY TO_STRM FUNCTION 
 def to_strm(method):
+    library_index = LibraryIndex.for_plugin(source_platform, media_folder)
+    library_index.start_run()
+    # Pick up a forced refresh done from the CLI or the UI
+    ChannelCache.for_plugin(source_platform).load()
     for twitch_channel in channels:
         log_text = ("Preparing channel {}".format(twitch_channel))
         l.log("twitch", log_text)
@@ -314,23 +332,26 @@ def to_strm(method):
         )
         ## -- END
 
-        ## -- BUILD CHANNEL NFO FILE
-        n.nfo(
-            "tvshow",
-            "{}/{}".format(
-                media_folder, 
-                "{}".format(
-                    twitch.channel
-                )
-            ),
-            {
-                "title" : twitch.channel_name,
-                "plot" : "",
-                "landscape" : twitch.images['landscape'],
-                "poster" : twitch.images['poster'],
-                "studio" : "Twitch"
-            }
-        ).make_nfo()
+        ## -- BUILD CHANNEL NFO FILE (only when the metadata changed)
+        if twitch.metadata_changed or not os.path.isfile(
+            "{}/{}/tvshow.nfo".format(media_folder, twitch.channel)
+        ):
+            n.nfo(
+                "tvshow",
+                "{}/{}".format(
+                    media_folder, 
+                    "{}".format(
+                        twitch.channel
+                    )
+                ),
+                {
+                    "title" : twitch.channel_name,
+                    "plot" : "",
+                    "landscape" : twitch.images['landscape'],
+                    "poster" : twitch.images['poster'],
+                    "studio" : "Twitch"
+                }
+            ).make_nfo()
         ## -- END 
         
         ## -- GET ON AIR STREAMING
@@ -420,12 +441,11 @@ def to_strm(method):
             else:
                 log_text = ("The channel is not currently live")
                 l.log("twitch", log_text)
-                try:
-                    os.remove( file_path )
-                    os.remove( file_path.replace('.strm','.nfo'))
-                    os.remove( file_path.replace('.strm','.png'))
-                except:
-                    pass
+                for extension in ['.strm', '.nfo', '.png', '.jpg', '.webp']:
+                    try:
+                        os.remove( file_path.replace('.strm', extension))
+                    except:
+                        pass
         ## -- END
 
         ## -- GET VIDEOS TAB
@@ -453,6 +473,7 @@ def to_strm(method):
                         video_name
                     )
                     video_name = re.sub(r'\d{4}-\d{2}-\d{2} \d{4}', '', video_name).strip()
+                    duration, width, height, vcodec, acodec = str(line).rstrip().split(';')[-5:]
                     video_name = "{} [{}]".format(
                         video_name,
                         video_id
@@ -478,18 +499,6 @@ def to_strm(method):
                     # Create season folder based on video year
                     season_folder = f"Season {year}"
                     folder_full_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
-                    
-                    # Format title with episode number
-                    use_mmdd = (episode_format.lower() == 'mmdd')
-                    formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
-                    
-                    file_path = "{}/{}/{}/{}.{}".format(
-                        media_folder,
-                        channel_folder,
-                        season_folder,
-                        sanitize(formatted_title),
-                        "strm"
-                    )
 
                     folder_path = "{}/{}".format(
                         media_folder,  
@@ -500,10 +509,23 @@ def to_strm(method):
                         )
                     )
 
-                    if video_id_exists_in_content(folder_path, video_id):
+                    if library_index.contains(video_id, folder_path):
                         l.log("twitch", f'Video {video_id} already exists')
                         continue
 
+                    # Format title with episode number (allocates the number,
+                    # so only for videos that are going to be written)
+                    use_mmdd = (episode_format.lower() == 'mmdd')
+                    formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
+
+                    file_path = "{}/{}/{}/{}.{}".format(
+                        media_folder,
+                        channel_folder,
+                        season_folder,
+                        sanitize(formatted_title),
+                        "strm"
+                    )
+
                     data = {
                         "video_id" : video_id, 
                         "video_name" : video_name
@@ -532,7 +554,12 @@ def to_strm(method):
                             "plot" : description.replace('\n', ' <br/>\n '),
                             "season" : "1",
                             "episode" : "",
-                            "preview" : thumbnail
+                            "preview" : thumbnail,
+                            "duration" : duration,
+                            "width" : width,
+                            "height" : height,
+                            "vcodec" : vcodec,
+                            "acodec" : acodec
                         }
                     ).make_nfo()
                     ## -- END
@@ -542,7 +569,11 @@ def to_strm(method):
                             file_path, 
                             file_content
                         )
+                    library_index.add(video_id, file_path, folder_path)
         
+        library_index.save()
+        ArtworkDownloader.shared().drain()
+
         # Notify Jellyfin/Emby after processing all videos for this channel
         jellyfin_notifier = JellyfinNotifier(config)
         if jellyfin_notifier.enabled:
@@ -553,16 +584,7 @@ def to_strm(method):
 ## -- END
 
 ## --  REDIRECT VIDEO DATA 
-def direct(twitch_id, remote_addr): 
-    current_time = time.time()
-    cache_key = f"{remote_addr}_{twitch_id}"
-    
-    # Check if the request is already cached
-    if cache_key not in recent_requests:
-        log_text = f'[{remote_addr}] Playing {twitch_id}'
-        l.log("twitch", log_text)
-        recent_requests[cache_key] = current_time
-
+def resolve(twitch_id):
     channel = twitch_id.split("@")[0]
     video_id = twitch_id.split("@")[1]
     command = [
@@ -598,10 +620,42 @@ def direct(twitch_id, remote_addr):
             set_cookies_to_command(command_live)
             twitch_url = w.worker(command_live).output()
 
-    twitch_url = twitch_url.strip()
+    return twitch_url.strip()
+
+resolve_flights = SingleFlight("twitch")
+
+def direct(twitch_id, remote_addr, probe=False):
+    if probe:
+        # Media server scans probe every new STRM, only playback resolves
+        count("twitch", "direct", "probe", "light")
+        return light_response(request, 'application/vnd.apple.mpegurl')
+    count("twitch", "direct", "play", "resolved")
+    current_time = time.time()
+    cache_key = f"{remote_addr}_{twitch_id}"
+    
+    # Check if the request is already cached
+    if cache_key not in recent_requests:
+        log_text = f'[{remote_addr}] Playing {twitch_id}'
+        l.log("twitch", log_text)
+        recent_requests[cache_key] = current_time
+
+    # Concurrent requests of the same video share one resolution
+    try:
+        twitch_url = resolve_flights.do(twitch_id, lambda: resolve(twitch_id))
+    except concurrent.futures.TimeoutError:
+        l.log("twitch", f'Timed out resolving {twitch_id}')
+        return "Timed out resolving the video.", 504
+    except Exception as e:
+        l.log("twitch", f'Error resolving {twitch_id}: {e}')
+        return "Error resolving the video.", 502
+
     return redirect(twitch_url, code=301)
 
-def bridge(twitch_id):
+def bridge(twitch_id, probe=False):
+    if probe:
+        count("twitch", "bridge", "probe", "light")
+        return light_response(request, 'video/mp4')
+    count("twitch", "bridge", "play", "resolved")
     channel = twitch_id.split("@")[0]
     video_id = twitch_id.split("@")[1]
 
@@ -658,9 +712,6 @@ def bridge(twitch_id):
 
 
     def generate():
-        startTime = time.time()
-        buffer = []
-        sentBurst = False
         command = [
             'yt-dlp', 
             '-o', '-',
@@ -672,35 +723,7 @@ def bridge(twitch_id):
 
         set_cookies_to_command(command)
         
-        process = w.worker(command).pipe()
-        try:
-            while True:
-                # Get some data from ffmpeg
-                line = process.stdout.read(1024)
-
-                # We buffer everything before outputting it
-                buffer.append(line)
-
-                # Minimum buffer time, 3 seconds
-                if sentBurst is False and time.time() > startTime + 3 and len(buffer) > 0:
-                    sentBurst = True
-
-                    for i in range(0, len(buffer) - 2):
-                        log_text = ("Send initial burst #", i)
-                        l.log("twitch", log_text)
-                        yield buffer.pop(0)
-
-                elif time.time() > startTime + 3 and len(buffer) > 0:
-                    yield buffer.pop(0)
-
-                process.poll()
-                if isinstance(process.returncode, int):
-                    if process.returncode > 0:
-                        log_text = ('yt-dlp Error', process.returncode)
-                        l.log("twitch", log_text)
-                    break
-        finally:
-            process.kill()
+        yield from w.worker(command).buffered()
 
     return Response(
         stream_with_context(generate()), 
@@ -1,6 +1,7 @@
 from __main__ import app
-from plugins.youtube.youtube import direct, bridge, download
+from plugins.youtube.youtube import direct, bridge, download, prewarm, manifest, media_playlist, segment
 from flask import request, Response  # Importa request y Response desde Flask
+from clases.probe.probe import is_probe
 
 ### YOUTUBE ZONE
 #Redirect to best pre-merget format youtube url
@@ -13,20 +14,47 @@ def youtube_direct(youtube_id):
         response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
         response.headers['Access-Control-Allow-Headers'] = 'Range, Content-Type'
         return response
-    return direct(youtube_id, request.remote_addr)
+    return direct(youtube_id, request.remote_addr, request.headers.get('User-Agent'), is_probe(request))
+
+#Manifest saved for an upstream STRM (strm_content upstream)
+@app.route("/youtube/manifest/<youtube_id>")
+def youtube_manifest(youtube_id):
+    return manifest(youtube_id, request.remote_addr, request.headers.get('User-Agent'), is_probe(request))
+
+#Media playlist of a proxied direct manifest (SponsorBlock segments left out)
+@app.route("/youtube/hls/<youtube_id>/<int:index>.m3u8")
+def youtube_hls(youtube_id, index):
+    return media_playlist(youtube_id, index)
+
+#Segment of a proxied media playlist, served from the segment cache
+@app.route("/youtube/segment/<youtube_id>/<int:index>/<int:number>")
+def youtube_segment(youtube_id, index, number):
+    return segment(youtube_id, index, number)
 
 #Redirect to best pre-merget format youtube url
 @app.route("/youtube/bridge/<youtube_id>")
 def youtube_bridge(youtube_id):
-    return bridge(youtube_id)
+    return bridge(youtube_id, is_probe(request))
 
 #Keep URL from v0 version
 @app.route("/youtube/redirect/<youtube_id>")
 def youtube_redirect(youtube_id):
-    return direct(youtube_id, request.remote_addr)
+    return direct(youtube_id, request.remote_addr, request.headers.get('User-Agent'), is_probe(request))
 
 
 #Download video and semd data throught http (serve video duration info, disk usage **clean_old_videos fucntion save your money)
 @app.route("/youtube/download/<youtube_id>")
 def youtube_download(youtube_id):
-    return download(youtube_id)
+    return download(youtube_id, is_probe(request))
+
+
+#Resolve new videos in the background, posted by a scan run from the command line
+@app.route("/youtube/prewarm", methods=['POST'])
+def youtube_prewarm():
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+        return "Forbidden", 403
+    video_ids = request.get_json(silent=True)
+    if not isinstance(video_ids, list):
+        return "Expected a JSON list of video IDs", 400
+    prewarm([str(video_id) for video_id in video_ids])
+    return "", 202
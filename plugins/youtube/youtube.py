@@ -1,15 +1,22 @@
 import os
 import json
 import time
-import platform
 import subprocess
 import requests
 import html
 import re
+import threading
+import itertools
+import sys
+from collections import deque
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from cachetools import TTLCache
+from urllib.parse import urljoin
+from cachetools import TTLCache, TLRUCache
 from utils.episode_numbering import format_episode_title
 from utils.sanitize import sanitize
+from utils import hls
 from flask import stream_with_context, Response, send_file, redirect, abort, request
 from clases.config import config as c
 from clases.worker import worker as w
@@ -17,8 +24,22 @@ from clases.folders import folders as f
 from clases.nfo import nfo as n
 from clases.log import log as l
 from clases.jellyfin_notifier.jellyfin_notifier import JellyfinNotifier
+from clases.library_index.library_index import LibraryIndex, cache_folder
+from clases.channel_cache.channel_cache import ChannelCache
+from clases.artwork.artwork import ArtworkDownloader
+from clases.single_flight.single_flight import SingleFlight
+from clases.prewarm.prewarm import Prewarmer
+from clases.progressive.progressive import ProgressiveDownload, sniff_audio
+from clases.temp_media.temp_media import TempMedia, temp_folder
+from clases.cookie_jar.cookie_jar import cookie_args
+from clases.probe.probe import light_response, count
+from clases.upstream_strm.upstream_strm import UpstreamStrm
+from clases.sponsorblock.sponsorblock import SponsorBlock
+from clases.segment_cache.segment_cache import SegmentCache, segment_mimetype
 
 recent_requests = TTLCache(maxsize=200, ttl=30)
+folder_locks = {}
+folder_locks_lock = threading.Lock()
 
 ## -- LOAD CONFIG AND CHANNELS FILES
 ytdlp2strm_config = c.config(
@@ -53,7 +74,116 @@ try:
 except:
     episode_format = 'sequential'
 
+try:
+    channel_metadata_ttl = int(config["channel_metadata_ttl"])
+except:
+    channel_metadata_ttl = 86400
+
+try:
+    incremental_scan = str(config["incremental_scan"]).lower() == 'true'
+except:
+    incremental_scan = False
+
+try:
+    channel_concurrency = max(1, int(config["channel_concurrency"]))
+except:
+    channel_concurrency = 1
+
+try:
+    # Newest new videos per channel resolved after a direct scan, 0 disables it
+    prewarm_newest = max(0, int(config["prewarm_newest"]))
+except:
+    prewarm_newest = 0
+
+try:
+    prewarm_concurrency = max(1, int(config["prewarm_concurrency"]))
+except:
+    prewarm_concurrency = 1
+
+try:
+    # Resolved manifests kept for direct (LRU)
+    resolve_cache_size = max(1, int(config["resolve_cache_size"]))
+except:
+    resolve_cache_size = 256
+
+try:
+    # Seconds before the expiry of a resolved URL it stops being reused
+    resolve_cache_margin = int(config["resolve_cache_margin"])
+except:
+    resolve_cache_margin = 900
+
+# Variant served by direct: best, height<=N or bandwidth<=N
+hls_variant_policy = config.get("hls_variant_policy", "best") or "best"
+# Per client policies: "User-Agent substring:policy;..."
+hls_user_agent_policies = config.get("hls_user_agent_policies", "")
+
+try:
+    # BANDWIDTH advertised for the served variant, 0 keeps the real one. A
+    # low value keeps Jellyfin from transcoding because of its bitrate limit
+    hls_advertised_bandwidth = int(config["hls_advertised_bandwidth"])
+except:
+    hls_advertised_bandwidth = 279001
+
+try:
+    hls_fetch_timeout = float(config["hls_fetch_timeout"])
+except:
+    hls_fetch_timeout = 10
+
+# server   : STRMs point to this server (/youtube/direct/<id>)
+# upstream : the most recently watched/added direct STRMs point to the
+#            resolved URL (or a manifest file served as is) and are rewritten
+#            before it expires, the rest keep the server URL. Jellyfin/Emby
+#            only read a STRM on a scan or a refresh of its item, each
+#            rewrite asks for that refresh (jellyfin_integration)
+strm_content = str(config.get("strm_content", "server")).lower()
+
+try:
+    upstream_hot_items = max(0, int(config["upstream_hot_items"]))
+except:
+    upstream_hot_items = 50
+
+try:
+    upstream_refresh_concurrency = max(1, int(config["upstream_refresh_concurrency"]))
+except:
+    upstream_refresh_concurrency = 2
+
+try:
+    # Seconds before the expiry of the URL an upstream STRM is rewritten
+    upstream_refresh_margin = int(config["upstream_refresh_margin"])
+except:
+    upstream_refresh_margin = 1800
+
+sponsorblock = str(config.get("sponsorblock", False)).lower() == 'true'
+# manifest : direct serves media playlists without the segments, bridge
+#            remuxes that playlist, playback starts as fast as direct
+# remove   : yt-dlp downloads the whole video and cuts it (older versions)
+sponsorblock_mode = str(config.get("sponsorblock_mode", "manifest")).lower()
+sponsorblock_all_categories = ['sponsor', 'intro', 'outro', 'selfpromo', 'preview', 'filler', 'interaction', 'music_offtopic']
+sponsorblock_categories = [category.strip() for category in str(config.get("sponsorblock_cats", "sponsor")).split(',') if category.strip()]
+if 'all' in sponsorblock_categories or 'default' in sponsorblock_categories:
+    sponsorblock_categories = sponsorblock_all_categories
+# Segments are looked up while the video resolves
+sponsorblock_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='sponsorblock')
+# Seconds direct waits for them once the video is resolved, the video plays
+# uncut if they are not there by then
+sponsorblock_wait = 1
+
+# Segments of direct HLS playback go through this server and are kept on
+# disk, so other clients and seeks don't fetch them from YouTube again
+hls_segment_proxy = str(config.get("hls_segment_proxy", False)).lower() == 'true'
+
+try:
+    hls_segment_cache_mb = max(1, int(config["hls_segment_cache_mb"]))
+except:
+    hls_segment_cache_mb = 2048
+
+# URLs without expire= are reused this long
+resolve_default_ttl = 1800
+
 source_platform = "youtube"
+# Fields of each video used by to_strm
+video_fields = ['id', 'title', 'upload_date', 'thumbnail', 'description', 'channel_id', 'uploader_id',
+                'duration', 'width', 'height', 'vcodec', 'acodec']
 host = ytdlp2strm_config['ytdlp2strm_host']
 port = ytdlp2strm_config['ytdlp2strm_port']
 
@@ -79,6 +209,8 @@ class Youtube:
         self.channel_description = None
         self.channel_poster = None
         self.channel_landscape = None
+        self.channel_metadata = None
+        self.channel_metadata_changed = False
     
     def get_results(self):
         if 'extractaudio-' in self.channel:
@@ -148,426 +280,239 @@ class Youtube:
             return self.get_channel_videos()
     
     def get_list_videos(self):
-        command = [
-            'yt-dlp', 
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1', 
-            '--playlist-end', str(videos_limit), 
-            '--no-warning',
-            '--dump-json',
-            self.channel_url
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                
-                video = {
-                    'id': data.get('id'),
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': self.channel_url.split('list=')[1],
-                    'uploader_id': sanitize(self.channel_name)
-                }
-                videos.append(video)
-        
-        return videos
+        video_ids = self.get_new_video_ids(self.channel_url)
+        return (
+            self.to_video(
+                data,
+                channel_id=self.channel_url.split('list=')[1],
+                uploader_id=sanitize(self.channel_name)
+            )
+            for data in self.get_videos_details(video_ids, dateafter=False)
+        )
     
     def get_keyword_videos(self):
         keyword = self.channel.split('-')[1]
-        command = [
-            'yt-dlp', 
-            '-f', 'best', 'ytsearch:["{}"]'.format(keyword),
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1', 
-            '--playlist-end', videos_limit, 
-            '--no-warning',
-            '--dump-json'
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-
-        if config['days_dateafter'] == "0":
-            command.pop(8)
-            command.pop(8)
-
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                
-                video = {
-                    'id': data.get('id'),
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-        
-        return videos
+        video_ids = self.get_new_video_ids('ytsearch{}:["{}"]'.format(videos_limit, keyword))
+        return (
+            self.to_video(data)
+            for data in self.get_videos_details(video_ids, dateafter=False)
+        )
     
     def get_keyword_audios(self):
         keyword = self.channel.split('-')[1]
-        command = [
-            'yt-dlp', 
-            '-f', 'best', 'ytsearch10:["{}"]'.format(keyword),
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--playlist-start', '1', 
-            '--playlist-end', videos_limit, 
-            '--no-warning',
-            '--dump-json'
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-
-        if config['days_dateafter'] == "0":
-            command.pop(8)
-            command.pop(8)
-
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                
-                video = {
-                    'id': f"{data.get('id')}-audio",
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-        
-        return videos
+        video_ids = self.get_new_video_ids('ytsearch10:["{}"]'.format(keyword), audio=True)
+        return (
+            self.to_video(data, audio=True)
+            for data in self.get_videos_details(video_ids, dateafter=False)
+        )
     
     def get_channel_audios(self):
-        cu = self.channel
+        cu = self.channel_url
 
         if not '/streams' in self.channel:
             cu = f'{self.channel_url}/videos'
 
-        command = [
-            'yt-dlp', 
-            '--compat-options', 'no-youtube-channel-redirect',
-            '--compat-options', 'no-youtube-unavailable-videos',
-            '--dateafter', f"today-{days_dateafter}days", 
-            '--playlist-start', '1', 
-            '--playlist-end', str(videos_limit), 
-            '--no-warning',
-            '--dump-json',
-            f'{cu}'
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-
-        result = w.worker(command).output()
-        # Procesa la salida JSON
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                video = {
-                    'id': f"{data.get('id')}-audio",
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-        
-        return videos
+        video_ids = self.get_new_video_ids(cu, audio=True)
+        return (
+            self.to_video(data, audio=True)
+            for data in self.get_videos_details(video_ids)
+        )
     
     def get_list_audios(self):
+        video_ids = self.get_new_video_ids(self.channel_url, audio=True)
+        return (
+            self.to_video(
+                data,
+                audio=True,
+                channel_id=self.channel_url.split('list=')[1],
+                uploader_id=sanitize(self.channel_name)
+            )
+            for data in self.get_videos_details(video_ids, dateafter=False)
+        )
+    
+    def get_channel_videos(self):
+        cu = self.channel_url
+
+        if not '/streams' in self.channel:
+            cu = f'{self.channel_url}/videos'
+
+        video_ids = self.get_new_video_ids(cu)
+        return (
+            self.to_video(data)
+            for data in self.get_videos_details(video_ids)
+        )
+
+    def get_new_video_ids(self, url, audio=False):
+        # Cheap flat enumeration of the listing (no watch page per video),
+        # newest first, without the IDs that already have a STRM in the
+        # folder of this channel. Unknown until its first scan (and for
+        # keyword searches): every ID goes on to channel_to_strm, which
+        # checks each one against its own folder
         command = [
             'yt-dlp', 
             '--compat-options', 'no-youtube-channel-redirect',
             '--compat-options', 'no-youtube-unavailable-videos',
+            '--flat-playlist',
             '--playlist-start', '1', 
             '--playlist-end', str(videos_limit), 
             '--no-warning',
-            '--dump-json',
-            self.channel_url
+            '--print', '%(id)s',
+            url
         ]
         self.set_cookies(command)
         self.set_language(command)
-        result = w.worker(command).output()
-        videos = []
-        for line in result.split('\n'):
-            if line.strip():
-                data = json.loads(line)
-                
-                video = {
-                    'id': f"{data.get('id')}-audio",
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': self.channel_url.split('list=')[1],
-                    'uploader_id': sanitize(self.channel_name)
-                }
-                videos.append(video)
-        
-        return videos
-    
-    def get_channel_videos(self):
-        cu = self.channel
+        self.set_proxy(command)
 
-        if not '/streams' in self.channel:
-            cu = f'{self.channel}/videos'
-            
+        library_index = LibraryIndex.for_plugin(source_platform, media_folder)
+        folder_path = library_index.folder_of(self.channel)
+        video_ids = []
+        # IDs are read as yt-dlp prints them, so the listing can stop at the
+        # first known one without enumerating the rest
+        listing = w.worker(command).lines()
+        try:
+            for line in listing:
+                video_id = line.strip()
+                if not video_id or video_id == 'NA':
+                    continue
+                if folder_path and library_index.contains(f'{video_id}-audio' if audio else video_id, folder_path):
+                    if incremental_scan:
+                        # Everything after the first known video is known too
+                        break
+                    continue
+                video_ids.append(video_id)
+        finally:
+            # Stops yt-dlp if it is still listing
+            listing.close()
+
+        l.log("youtube", f'New videos in listing: {len(video_ids)}')
+        return video_ids
+
+    def get_videos_details(self, video_ids, dateafter=True):
+        # Full extraction only for the new IDs, printing only the fields
+        # to_strm needs instead of the whole info dict. Videos are yielded
+        # as yt-dlp prints them, oldest first so they get the lower episode
+        # numbers
+        if not video_ids:
+            return
 
         command = [
             'yt-dlp', 
-            '--compat-options', 'no-youtube-channel-redirect',
             '--compat-options', 'no-youtube-unavailable-videos',
-            '--dateafter', f"today-{days_dateafter}days", 
-            '--playlist-start', '1', 
-            '--playlist-end', str(videos_limit), 
+            '--ignore-errors',
             '--no-warning',
-            '--dump-json',
-            f'{cu}'
+            '--print', '%(.{{{}}})j'.format(','.join(video_fields))
         ]
+        if dateafter:
+            command.extend(['--dateafter', f"today-{days_dateafter}days"])
         self.set_cookies(command)
         self.set_language(command)
-        result = w.worker(command).output()
-        # Procesa la salida JSON
-        videos = []
-        for line in result.split('\n'):
+        self.set_proxy(command)
+        command.extend(
+            f'https://www.youtube.com/watch?v={video_id}' for video_id in reversed(video_ids)
+        )
+
+        for line in w.worker(command).lines():
             if line.strip():
-                data = json.loads(line)                
-                video = {
-                    'id': data.get('id'),
-                    'title': data.get('title'),
-                    'upload_date': data.get('upload_date'),
-                    'thumbnail': data.get('thumbnail'),
-                    'description': data.get('description'),
-                    'channel_id': data.get('channel_id'),
-                    'uploader_id': data.get('uploader_id')
-                }
-                videos.append(video)
-        
-        return videos
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
 
-    def get_channel_name(self):
-        #get channel or playlist name
-        if 'playlist' in self.channel_url:
-            command = ['yt-dlp', 
+    def to_video(self, data, audio=False, channel_id=None, uploader_id=None):
+        return {
+            'id': f"{data.get('id')}-audio" if audio else data.get('id'),
+            'title': data.get('title'),
+            'upload_date': data.get('upload_date'),
+            'thumbnail': data.get('thumbnail'),
+            'description': data.get('description') or '',
+            'channel_id': channel_id if channel_id else data.get('channel_id'),
+            'uploader_id': uploader_id if uploader_id else data.get('uploader_id'),
+            # Written to the episode NFO so the media server doesn't probe
+            'duration': data.get('duration'),
+            'width': None if audio else data.get('width'),
+            'height': None if audio else data.get('height'),
+            'vcodec': None if audio else data.get('vcodec'),
+            'acodec': data.get('acodec')
+        }
+
+    def get_channel_metadata(self):
+        # Name, description, avatar and banner from a single extraction of
+        # the channel (or playlist) tab, without listing any video
+        if self.channel_metadata is not None:
+            return self.channel_metadata
+
+        channel_cache = ChannelCache.for_plugin(source_platform)
+        self.channel_metadata = channel_cache.get(self.channel_url, channel_metadata_ttl)
+        if self.channel_metadata is not None:
+            return self.channel_metadata
+
+        command = ['yt-dlp', 
                     '--compat-options', 'no-youtube-unavailable-videos',
-                    '--print', '%(playlist_title)s', 
-                    '--playlist-items', '1',
-                    '--restrict-filenames',
-                    '--ignore-errors',
-                    '--no-warnings',
                     '--compat-options', 'no-youtube-channel-redirect',
+                    '--flat-playlist',
+                    '--playlist-items', '0',
+                    '--dump-single-json',
+                    '--ignore-errors',
                     '--no-warnings',
                     f'{self.channel_url}'
-            ]
-        else:
-            # Use uploader (friendly name) instead of channel (@-name)
-            # First try to get uploader (friendly name)
-            command = ['yt-dlp', 
-                        '--compat-options', 'no-youtube-unavailable-videos',
-                        '--print', '%(uploader)s',
-                        '--restrict-filenames',
-                        '--ignore-errors',
-                        '--no-warnings',
-                        '--playlist-items', '1',
-                        '--compat-options', 'no-youtube-channel-redirect',
-                        f'{self.channel_url}'
-            ]
+        ]
         self.set_cookies(command)
         self.set_language(command)
         self.set_proxy(command)
-        channel_name = w.worker(command).output().strip().replace('"', '')
-        
-        # If uploader is empty, NA, or literally "channel", try channel field
-        if not channel_name or channel_name == 'NA' or channel_name.lower() == 'channel':
-            command = ['yt-dlp', 
-                        '--compat-options', 'no-youtube-unavailable-videos',
-                        '--print', '%(channel)s',
-                        '--restrict-filenames',
-                        '--ignore-errors',
-                        '--no-warnings',
-                        '--playlist-items', '1',
-                        '--compat-options', 'no-youtube-channel-redirect',
-                        f'{self.channel_url}'
-            ]
-            self.set_cookies(command)
-            self.set_language(command)
-            self.set_proxy(command)
-            channel_name = w.worker(command).output().strip().replace('"', '')
-        
+
+        try:
+            data = json.loads(w.worker(command).output()) or {}
+        except Exception as e:
+            l.log("youtube", f"Error getting channel metadata: {e}")
+            data = {}
+
+        if 'playlist' in self.channel_url:
+            channel_name = data.get('title')
+        else:
+            # Use uploader (friendly name) instead of channel (@-name)
+            channel_name = data.get('uploader')
+            # If uploader is empty, NA, or literally "channel", try channel field
+            if not channel_name or channel_name == 'NA' or channel_name.lower() == 'channel':
+                channel_name = data.get('channel')
+
         # Final fallback: use URL
         if not channel_name or channel_name == 'NA':
             channel_name = self.channel_url.split('/')[-1]
-        
-        self.channel_name = channel_name
+
+        poster = None
+        landscape = None
+        for thumbnail in data.get('thumbnails') or []:
+            if thumbnail.get('id') == 'avatar_uncropped':
+                poster = thumbnail.get('url')
+            elif thumbnail.get('id') == 'banner_uncropped':
+                landscape = thumbnail.get('url')
+
+        self.channel_metadata = {
+            "name" : channel_name.replace('"', ''),
+            "description" : data.get('description') or '',
+            "poster" : poster,
+            "landscape" : landscape
+        }
+        if data:
+            # Failed extractions are not cached
+            self.channel_metadata_changed = channel_cache.set(self.channel_url, self.channel_metadata)
+        return self.channel_metadata
+
+    def get_channel_name(self):
+        #get channel or playlist name
+        self.channel_name = self.get_channel_metadata()['name']
         return sanitize(self.channel_name)
      
     def get_channel_description(self):
         #get description
-        if platform.system() == "Linux":
-            command = [
-                'yt-dlp', 
-                self.channel_url, 
-                '--write-description', 
-                '--playlist-items', '0',
-                '--output', '"{}/{}.description"'.format(
-                    media_folder, 
-                    sanitize(self.channel_name)
-                )
-            ]
-            self.set_cookies(command)
-            self.set_language(command)
-            self.set_proxy(command)
-            command = (
-                command 
-                + [
-                    '>', 
-                    '/dev/null', 
-                    '2>&1',
-                    '&&', 
-                    'cat', 
-                    '"{}/{}.description"'.format(
-                        media_folder, 
-                        sanitize(
-                            self.channel_name
-                        )
-                    )
-                ]
-            )
-            
-
-            self.channel_description = w.worker(command).shell()
-            try:
-                os.remove("{}/{}.description".format(media_folder,sanitize(self.channel_name)))
-            except:
-                pass
-        else:
-            command = [
-                'yt-dlp', 
-                '--write-description', 
-                '--playlist-items', '0',
-                '--output', '"{}/{}.description"'.format(
-                    media_folder, 
-                    sanitize(
-                        self.channel_name
-                    )
-                ),
-                self.channel_url, 
-            ]
-            self.set_cookies(command)
-            self.set_language(command)
-            self.set_proxy(command)
-            command = (
-                command 
-                + [
-                    '>', 
-                    'nul', 
-                    '2>&1', 
-                    '&&', 
-                    'more', 
-                    '"{}/{}.description"'.format(
-                        media_folder,
-                        sanitize(
-                            self.channel_name
-                        )
-                    )
-                ]
-            )
-
-            try:
-                self.channel_description = w.worker(command).shell()
-            except:
-                d_file = open(
-                    "{}/{}.description".format(
-                        media_folder,
-                        sanitize(
-                            self.channel_name
-                        )
-                    ),
-                    'r',
-                    encoding='utf-8'
-                )
-
-                self.channel_description = d_file.read()
-                d_file.close()
-
-            try:
-                os.remove(
-                    "{}/{}.description".format(
-                        media_folder,
-                        sanitize(
-                            self.channel_name
-                        )
-                    )
-                )
-            except:
-                pass
-
+        self.channel_description = self.get_channel_metadata()['description']
         return self.channel_description
     
     def get_channel_images(self):
-        command = ['yt-dlp', 
-                    '--list-thumbnails',
-                    '--restrict-filenames',
-                    '--ignore-errors',
-                    '--no-warnings',
-                    '--playlist-items', '0',
-                    self.channel_url
-        ]
-        self.set_cookies(command)
-        self.set_language(command)
-        self.set_proxy(command)
-        landscape = None
-        poster = None
-        
-        try:
-            output = w.worker(command).output()
-            lines = output.split('\n')
-
-            # Parse thumbnails looking for specific IDs
-            for line in lines:
-                line = line.strip()
-                
-                # Look for avatar_uncropped (poster)
-                if 'avatar_uncropped' in line:
-                    parts = line.split()
-                    # URL is the last part
-                    if len(parts) >= 4:
-                        poster = parts[-1]
-                
-                # Look for banner_uncropped (landscape)
-                if 'banner_uncropped' in line:
-                    parts = line.split()
-                    # URL is the last part
-                    if len(parts) >= 4:
-                        landscape = parts[-1]
-                        
-        except Exception as e:
-            l.log("youtube", f"Error getting channel images: {e}")
-            pass
-
+        metadata = self.get_channel_metadata()
         return {
-            "landscape" : landscape,
-            "poster" : poster
+            "landscape" : metadata['landscape'],
+            "poster" : metadata['poster']
         }
 
     def set_proxy(self, command):
@@ -577,10 +522,9 @@ class Youtube:
                 command.append(proxy_url)
     
     def set_cookies(self, command):
-        # Only add cookies if cookie_value is not empty
-        if cookie_value and cookie_value.strip():
-            command.append(f'--{cookies}')
-            command.append(cookie_value)
+        # Only add cookies if cookie_value is not empty. Browser cookies are
+        # read from the cached export (clases.cookie_jar)
+        command.extend(cookie_args(cookies, cookie_value))
     
     def set_language(self, command):
         """Configura el idioma para YouTube según la configuración"""
@@ -596,53 +540,6 @@ class Youtube:
             command.extend(['--extractor-args', ';'.join(extractor_args)])
 
 
-def filter_and_modify_bandwidth(m3u8_content):
-    lines = m3u8_content.splitlines()
-    
-    highest_bandwidth = 0
-    best_video_info = None
-    best_video_url = None
-    
-    media_lines = []
-    
-    high_audio = False
-    sd_audio = ""
-    
-    for i in range(len(lines)):
-        line = lines[i]
-        
-        if line.startswith("#EXT-X-STREAM-INF:"):
-            info = line
-            url = lines[i + 1]
-            bandwidth = int(info.split("BANDWIDTH=")[1].split(",")[0])
-
-            if bandwidth > highest_bandwidth:
-                highest_bandwidth = bandwidth
-                best_video_info = info.replace(f"BANDWIDTH={bandwidth}", "BANDWIDTH=279001")
-                best_video_url = url
-        
-        if line.startswith("#EXT-X-MEDIA:URI"):
-            if '234' in line:
-                high_audio = True
-                media_lines.append(line)
-            else:
-                sd_audio = line
-
-    if not high_audio and sd_audio:
-        media_lines.append(sd_audio)
-
-    # Create the final M3U8 content
-    final_m3u8 = "#EXTM3U\n#EXT-X-INDEPENDENT-SEGMENTS\n"
-    
-    # Add all EXT-X-MEDIA lines
-    for media_line in media_lines:
-        final_m3u8 += f"{media_line}\n"
-
-    if best_video_info and best_video_url:
-        final_m3u8 += f"{best_video_info}\n{best_video_url}\n"
-
-    return final_m3u8
-
 def clean_text(text):
     # Reemplazar los caracteres especiales habituales y eliminar los que no son necesarios
 
@@ -654,82 +551,81 @@ def clean_text(text):
     
     return text
 
-def video_id_exists_in_content(media_folder, video_id):
-    for root, dirs, files in os.walk(media_folder):
-        for file in files:
-            if file.endswith(".strm"):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r') as f:
-                    if video_id in f.read():
-                        return True
-    return False
+def channel_folder_lock(channel_folder):
+    with folder_locks_lock:
+        if channel_folder not in folder_locks:
+            folder_locks[channel_folder] = threading.Lock()
+        return folder_locks[channel_folder]
+
+def channel_to_strm(youtube_channel, method, library_index, prewarm_ids=None):
+    yt = Youtube(youtube_channel)
+    log_text = (" --------------- ")
+    l.log("youtube", log_text)
+    log_text = (f'Working {youtube_channel}...')
+    l.log("youtube", log_text)
+    videos = yt.get_results()
+    channel_name = yt.channel_name
+    channel_url = yt.channel_url
+    channel_description = yt.channel_description
+
+    log_text = (f'Channel URL: {channel_url}')
+    l.log("youtube", log_text)
+    log_text = (f'Channel Name: {channel_name}')
+    l.log("youtube", log_text)
+    log_text = (f'Channel Poster: {yt.channel_poster}')
+    l.log("youtube", log_text)
+    log_text = (f'Channel Landscape: {yt.channel_landscape}')
+    l.log("youtube", log_text)
+    log_text = ('Channel Description: ')
+    l.log("youtube", log_text)
+    log_text = (channel_description)
+    l.log("youtube", log_text)
+    
+    # Videos arrive one by one while yt-dlp is still extracting the rest
+    first_video = next(videos, None)
+    if first_video:
+        videos = itertools.chain([first_video], videos)
+        written = 0
+        # Videos arrive oldest first, the last ones are the newest
+        newest_ids = deque(maxlen=prewarm_newest)
+        channel_nfo = False
+        channel_folder_created = False
+        
+        # Get channel_id from first video to create channel folder and NFO
+        channel_id = first_video['channel_id']
+        youtube_channel_folder = first_video['uploader_id'].replace('/user/','@').replace('/streams','')
+        
+        channel_folder = sanitize(
+            "{} [{}]".format(
+                youtube_channel_folder,
+                channel_id
+            )
+        )
 
-def to_strm(method):
-    for youtube_channel in channels:
-        yt = Youtube(youtube_channel)
-        log_text = (" --------------- ")
-        l.log("youtube", log_text)
-        log_text = (f'Working {youtube_channel}...')
-        l.log("youtube", log_text)
-        videos = yt.get_results()
-        channel_name = yt.channel_name
-        channel_url = yt.channel_url
-        channel_description = yt.channel_description
+        if 'keyword' not in youtube_channel:
+            # Every video of a channel or playlist goes to this folder, the
+            # next listings skip the IDs already in it
+            library_index.set_folder(youtube_channel, "{}/{}".format(media_folder, channel_folder))
 
-        log_text = (f'Channel URL: {channel_url}')
-        l.log("youtube", log_text)
-        log_text = (f'Channel Name: {channel_name}')
-        l.log("youtube", log_text)
-        log_text = (f'Channel Poster: {yt.channel_poster}')
-        l.log("youtube", log_text)
-        log_text = (f'Channel Landscape: {yt.channel_landscape}')
-        l.log("youtube", log_text)
-        log_text = ('Channel Description: ')
-        l.log("youtube", log_text)
-        log_text = (channel_description)
-        l.log("youtube", log_text)
-        
-        if videos:
-            log_text = (f'Videos detected: {len(videos)}')
-            l.log("youtube", log_text)
-            # Reverse video list so oldest videos get lower episode numbers
-            videos.reverse()
-            channel_nfo = False
-            channel_folder_created = False
-            
-            # Get channel_id from first video to create channel folder and NFO
-            first_video = videos[0]
-            channel_id = first_video['channel_id']
-            youtube_channel_folder = first_video['uploader_id'].replace('/user/','@').replace('/streams','')
-            
+        # Channels sharing a folder (e.g. a channel and its /streams tab)
+        # are materialized one at a time
+        with channel_folder_lock(channel_folder):
             # Create channel folder
-            channel_folder = sanitize(
-                "{} [{}]".format(
-                    youtube_channel_folder,
-                    channel_id
-                )
-            )
             f.folders().make_clean_folder(
                 "{}/{}".format(media_folder, channel_folder),
                 False,
                 ytdlp2strm_config
             )
-            
-            # Create channel NFO with correct images
-            n.nfo(
-                "tvshow",
-                "{}/{}".format(media_folder, channel_folder),
-                {
-                    "title" : channel_name,
-                    "plot" : channel_description.replace('\n', ' <br/>'),
-                    "landscape" : yt.channel_landscape,
-                    "poster" : yt.channel_poster,
-                    "studio" : "Youtube"
-                }
-            ).make_nfo()
+        
+            # Create channel NFO with correct images, only when the channel
+            # metadata changed since the last scan
+            if yt.channel_metadata_changed or not os.path.isfile(
+                "{}/{}/tvshow.nfo".format(media_folder, channel_folder)
+            ):
+                write_channel_nfo("{}/{}".format(media_folder, channel_folder), yt)
             channel_nfo = True
             channel_folder_created = True
-            
+        
             for video in videos:
                 video_id = video['id']
                 channel_id = video['channel_id']
@@ -749,22 +645,11 @@ def to_strm(method):
                         channel_id
                     )
                 )
-                
+            
                 # Create season folder based on video year
                 season_folder = f"Season {year}"
                 folder_full_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
-                
-                # Format title with episode number
-                use_mmdd = (episode_format.lower() == 'mmdd')
-                formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
-                
-                file_path = "{}/{}/{}/{}.{}".format(
-                    media_folder,
-                    channel_folder,
-                    season_folder,
-                    sanitize(formatted_title),
-                    "strm"
-                )
+
 
                 folder_path = "{}/{}".format(
                     media_folder, 
@@ -776,10 +661,23 @@ def to_strm(method):
                     )
                 )
 
-                if video_id_exists_in_content(folder_path, video_id):
+                if library_index.contains(video_id, folder_path):
                     l.log("youtube", f'Video {video_id} already exists')
                     continue
 
+                # Format title with episode number (allocates the number, so
+                # only for videos that are going to be written)
+                use_mmdd = (episode_format.lower() == 'mmdd')
+                formatted_title = format_episode_title(video_name, folder_full_path, upload_date, use_mmdd)
+
+                file_path = "{}/{}/{}/{}.{}".format(
+                    media_folder,
+                    channel_folder,
+                    season_folder,
+                    sanitize(formatted_title),
+                    "strm"
+                )
+
                 if not channel_folder_created:
                     f.folders().make_clean_folder(
                         "{}/{}".format(
@@ -795,7 +693,7 @@ def to_strm(method):
                         ytdlp2strm_config
                     )
                     channel_folder_created = True
-                
+            
                 # Create season folder if it doesn't exist
                 season_folder_path = "{}/{}/{}".format(media_folder, channel_folder, season_folder)
                 if not os.path.exists(season_folder_path):
@@ -806,8 +704,8 @@ def to_strm(method):
                     channel = Youtube(
                         channel_url
                     )
-                    images = channel.get_channel_images()
                     channel.channel_url = channel_url
+                    images = channel.get_channel_images()
                     channel_name = channel.get_channel_name()
                     channel_description = channel.get_channel_description()
                     channel_landscape = images['landscape']
@@ -857,7 +755,12 @@ def to_strm(method):
                         "plot" : description.replace('\n', ' <br/>\n '),
                         "season" : "1",
                         "episode" : "",
-                        "preview" : thumbnail
+                        "preview" : thumbnail,
+                        "duration" : video.get('duration'),
+                        "width" : video.get('width'),
+                        "height" : video.get('height'),
+                        "vcodec" : video.get('vcodec'),
+                        "acodec" : video.get('acodec')
                     }
                 ).make_nfo()
                 ## -- END 
@@ -867,106 +770,544 @@ def to_strm(method):
                         file_path, 
                         file_content
                     )
-            
-            # Notify Jellyfin/Emby after processing all videos for this channel
-            jellyfin_notifier = JellyfinNotifier(config)
-            if jellyfin_notifier.enabled:
-                jellyfin_notifier.notify_new_content(f"{media_folder}/{channel_folder}")
-        else:
-            log_text = (" no videos detected...") 
-            l.log("youtube", log_text)
-
-
-def direct(youtube_id, remote_addr):
-    current_time = time.time()
-    cache_key = f"{remote_addr}_{youtube_id}"
-    
-    # Check if the request is already cached
-    if cache_key not in recent_requests:
-        log_text = f'[{remote_addr}] Playing {youtube_id}'
+                library_index.add(video_id, file_path, folder_path)
+                written += 1
+                newest_ids.append(video_id)
+        
+            library_index.save()
+        if prewarm_ids is not None:
+            prewarm_ids.extend(newest_ids)
+        log_text = (f'Videos written: {written}')
         l.log("youtube", log_text)
-        recent_requests[cache_key] = current_time
+        return True
+    else:
+        log_text = (" no videos detected...") 
+        l.log("youtube", log_text)
+        # The cache already holds the new metadata, the next scans won't
+        # see it as changed
+        folder_path = library_index.folder_of(youtube_channel)
+        if yt.channel_metadata_changed and folder_path and os.path.isdir(folder_path):
+            with channel_folder_lock(os.path.basename(folder_path)):
+                write_channel_nfo(folder_path, yt)
+            l.log("youtube", f'Channel metadata updated in {folder_path}')
+            # The media server reads the new tvshow.nfo on the next scan
+            return True
+        return False
+
+def write_channel_nfo(folder_path, yt):
+    n.nfo(
+        "tvshow",
+        folder_path,
+        {
+            "title" : yt.channel_name,
+            "plot" : yt.channel_description.replace('\n', ' <br/>'),
+            "landscape" : yt.channel_landscape,
+            "poster" : yt.channel_poster,
+            "studio" : "Youtube"
+        }
+    ).make_nfo()
 
-    if '-audio' not in youtube_id:
-        command = [
-            'yt-dlp', 
-            '-j',
-            '--no-warnings',
-            '--extractor-args', 'youtube:player-client=default,web_safari',
-            f'https://www.youtube.com/watch?v={youtube_id}'
-        ]
-        Youtube().set_cookies(command)
-        Youtube().set_proxy(command)
-        full_info_json_str = w.worker(command).output()
-        m3u8_url = None
-        try:
-            full_info_json = json.loads(full_info_json_str)
 
-            for fmt in full_info_json["formats"]:
-                if "manifest_url" in fmt.keys():
-                    m3u8_url = fmt["manifest_url"]
-                    break
-        except:
-            pass 
+def to_strm(method):
+    library_index = LibraryIndex.for_plugin(source_platform, media_folder)
+    library_index.start_run()
+    # Pick up a forced refresh done from the CLI or the UI
+    ChannelCache.for_plugin(source_platform).load()
+    prewarm_ids = []
+
+    def work(youtube_channel):
+        # Buffer the log of the channel so concurrent scans don't interleave
+        if channel_concurrency > 1:
+            l.begin_group()
+        try:
+            return channel_to_strm(youtube_channel, method, library_index, prewarm_ids)
+        except Exception as e:
+            l.log("youtube", f'Error working {youtube_channel}: {e}')
+            return False
+        finally:
+            l.end_group()
 
-        if not m3u8_url:
-            log_text = ('No manifest detected. Check your cookies config. \n* This video is age-restricted; some formats may be missing without authentication. Use --cookies-from-browser or --cookies for the authentication \n* Serving SD format. Please configure your cookies appropriately to access the manifest that serves the highest quality for this video')
-            l.log("youtube", log_text)
-            command = [
-                'yt-dlp',
-                '-f', 'best',
-                '--get-url',
-                '--no-warnings',
-                f'https://www.youtube.com/watch?v={youtube_id}'
-            ]
-            Youtube().set_proxy(command)
-            sd_url = w.worker(command).output()
-            return redirect(sd_url.strip(), 301)
-        else:
-            response = requests.get(m3u8_url)
-            if response.status_code == 200:
-                # Ensure UTF-8 encoding
-                response.encoding = 'utf-8'
-                m3u8_content = response.text
-                filtered_content = filter_and_modify_bandwidth(m3u8_content)
-                
-                # Create Response with headers optimized for VLC and media players
-                flask_response = Response(filtered_content, mimetype='application/vnd.apple.mpegurl')
-                flask_response.headers['Content-Type'] = 'application/vnd.apple.mpegurl; charset=utf-8'
-                flask_response.headers['Content-Disposition'] = 'inline; filename="index.m3u8"'
-                flask_response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                flask_response.headers['Pragma'] = 'no-cache'
-                flask_response.headers['Expires'] = '0'
-                flask_response.headers['Accept-Ranges'] = 'bytes'
-                flask_response.headers['Access-Control-Allow-Origin'] = '*'
-                flask_response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-                flask_response.headers['Access-Control-Allow-Headers'] = 'Range'
-                
-                return flask_response
+    if channel_concurrency > 1:
+        with ThreadPoolExecutor(max_workers=channel_concurrency) as executor:
+            results = list(executor.map(work, channels))
     else:
-        s_youtube_id = youtube_id.split('-audio')[0]
+        results = [work(youtube_channel) for youtube_channel in channels]
+
+    # Artwork is written in the background, wait for it before the library
+    # scan
+    ArtworkDownloader.shared().drain()
+
+    # Notify Jellyfin/Emby once after processing all channels
+    if any(results):
+        jellyfin_notifier = JellyfinNotifier(config)
+        if jellyfin_notifier.enabled:
+            jellyfin_notifier.notify_new_content(media_folder)
+
+    # Resolve the newest videos before their first play
+    if method == 'direct' and prewarm_newest > 0 and prewarm_ids:
+        prewarm(prewarm_ids)
+
+
+def expiry_from_url(url):
+    # googlevideo URLs carry their expiry as expire=<epoch> (query string) or
+    # /expire/<epoch>/ (manifest path)
+    match = re.search(r'[/?&]expire[/=](\d+)', url or '')
+    if match:
+        return int(match.group(1))
+    return time.time() + resolve_default_ttl
+
+def resolve_ttu(youtube_id, resolved, now):
+    # Evicted a safety margin before YouTube stops accepting the URL
+    return resolved['expire'] - resolve_cache_margin
+
+resolved_cache = TLRUCache(maxsize=resolve_cache_size, ttu=resolve_ttu, timer=time.time)
+resolved_cache_lock = threading.Lock()
+resolve_flights = SingleFlight("youtube")
+
+def resolve_video(youtube_id):
+    """
+    Find the HLS manifest of a video (or the SD format URL if there is
+    no manifest)
+
+    Returns:
+        dict: kind ('manifest' or 'redirect'), url, manifest (master
+              playlist), filtered, media and expire (epoch), None if
+              nothing was found
+    """
+    command = [
+        'yt-dlp', 
+        '-j',
+        '--no-warnings',
+        '--extractor-args', 'youtube:player-client=default,web_safari',
+        f'https://www.youtube.com/watch?v={youtube_id}'
+    ]
+    Youtube().set_cookies(command)
+    Youtube().set_proxy(command)
+    full_info_json_str = w.worker(command).output()
+    m3u8_url = None
+    try:
+        full_info_json = json.loads(full_info_json_str)
+
+        for fmt in full_info_json["formats"]:
+            if "manifest_url" in fmt.keys():
+                m3u8_url = fmt["manifest_url"]
+                break
+    except:
+        pass 
+
+    if not m3u8_url:
+        log_text = ('No manifest detected. Check your cookies config. \n* This video is age-restricted; some formats may be missing without authentication. Use --cookies-from-browser or --cookies for the authentication \n* Serving SD format. Please configure your cookies appropriately to access the manifest that serves the highest quality for this video')
+        l.log("youtube", log_text)
         command = [
             'yt-dlp',
-            '-f', 'bestaudio',
+            '-f', 'best',
             '--get-url',
             '--no-warnings',
-            f'https://www.youtube.com/watch?v={s_youtube_id}'
+            f'https://www.youtube.com/watch?v={youtube_id}'
         ]
-        Youtube().set_cookies(command)
         Youtube().set_proxy(command)
-        audio_url = w.worker(command).output()
-        return redirect(audio_url, 301)
+        sd_url = w.worker(command).output().strip()
+        if not sd_url:
+            return None
+        return {'kind': 'redirect', 'url': sd_url, 'expire': expiry_from_url(sd_url)}
+
+    start = time.perf_counter()
+    manifest = hls.fetch(m3u8_url, hls_fetch_timeout)
+    if manifest is None:
+        return None
+    l.log("youtube", f'Manifest fetched in {(time.perf_counter() - start) * 1000:.0f} ms')
+    return {
+        'kind': 'manifest',
+        'url': m3u8_url,
+        'manifest': manifest,
+        # Filtered manifest by variant policy
+        'filtered': {},
+        # Media playlists served by /youtube/hls, by URI index
+        'media': {},
+        'expire': expiry_from_url(m3u8_url)
+    }
+
+def filtered_manifest(resolved, policy):
+    # Filtered once per (video, policy) while the resolution is cached
+    content = resolved['filtered'].get(policy)
+    if content is None:
+        start = time.perf_counter()
+        content = hls.filter_master(resolved['manifest'], policy, hls_advertised_bandwidth)
+        resolved['filtered'][policy] = content
+        l.log("youtube", f'Manifest filtered ({policy}) in {(time.perf_counter() - start) * 1000:.2f} ms')
+    return content
+
+def served_manifest(resolved, policy, youtube_id, proxied=False):
+    """
+    Filtered manifest as served to the client. Proxied (SponsorBlock cut or
+    hls_segment_proxy), its rendition and variant URIs point to
+    /youtube/hls/<id>/<index>.m3u8 (the index of the URI in the master),
+    which serves the media playlist rewritten. The expiry of the resolution
+    goes along so the URIs still carry it.
+    """
+    content = filtered_manifest(resolved, policy)
+    if not proxied:
+        return content
+    key = f'{policy}|proxied'
+    if key not in resolved['filtered']:
+        indexes = {uri: index for index, uri in enumerate(hls.master_uris(resolved['manifest']))}
+        resolved['filtered'][key] = hls.rewrite_master(
+            content,
+            lambda uri: f'/{source_platform}/hls/{youtube_id}/{indexes[uri]}.m3u8?expire={int(resolved["expire"])}'
+        )
+    return resolved['filtered'][key]
+
+def sponsor_segments(youtube_id):
+    # Time ranges left out of the media playlists, none unless sponsorblock
+    # works at manifest level
+    if not sponsorblock or sponsorblock_mode != 'manifest' or '-audio' in youtube_id:
+        return []
+    return SponsorBlock.shared().segments(youtube_id, sponsorblock_categories)
+
+segment_cache = None
+if hls_segment_proxy and hasattr(sys.modules['__main__'], 'app'):
+    segment_cache = SegmentCache(
+        source_platform,
+        os.path.join(cache_folder, source_platform, 'segments'),
+        hls_segment_cache_mb * 1024 * 1024,
+        hls_fetch_timeout
+    )
+
+def cached_resolution(youtube_id):
+    return resolve_flights.do(youtube_id, lambda: resolve(youtube_id), lambda: cached_resolve(youtube_id))
+
+def media_content(resolved, youtube_id, index):
+    """
+    Media playlist served for a rendition or variant of a resolved video:
+    without the SponsorBlock segments (a discontinuity where they were) and,
+    with the segment cache, its segment URIs pointing to
+    /youtube/segment/<id>/<index>/<number>. Fetched and rewritten once per
+    resolution, every client and seek reuses it.
+
+    Returns:
+        tuple: (content, origin URL of each segment number, name of the
+               rendition in the segment cache), None if the playlist is
+               unknown or could not be fetched
+    """
+    media = resolved['media'].get(index)
+    if media:
+        return media
+    uris = hls.master_uris(resolved['manifest'])
+    if index >= len(uris):
+        return None
+    url = urljoin(resolved['url'], uris[index])
+    content = hls.fetch(url, hls_fetch_timeout)
+    if content is None:
+        l.log("youtube", f'Error fetching media playlist {index} of {youtube_id}')
+        return None
+
+    # A live playlist changes, only VOD ones are kept and proxied
+    vod = '#EXT-X-ENDLIST' in content
+    segments = []
+    if segment_cache and vod:
+        # Numbered before the cut, so a number always names the same
+        # segment of the video
+        numbers = {}
+        def proxy(uri):
+            if uri not in numbers:
+                numbers[uri] = len(segments)
+                segments.append(uri)
+            return f'/{source_platform}/segment/{youtube_id}/{index}/{numbers[uri]}'
+        content = hls.rewrite_segments(content, proxy, url)
+    else:
+        content = hls.rewrite_segments(content, lambda uri: uri, url)
+    ranges = sponsor_segments(youtube_id)
+    if ranges:
+        content = hls.remove_ranges(content, ranges)
+
+    # Segments are shared by every audio group listing the rendition, and
+    # survive a new resolution (the master may list it elsewhere)
+    media = (content, segments, hls.rendition_id(url) or f'index-{index}')
+    if vod:
+        resolved['media'][index] = media
+    return media
+
+def media_playlist(youtube_id, index):
+    try:
+        resolved = cached_resolution(youtube_id)
+    except Exception as e:
+        l.log("youtube", f'Error resolving {youtube_id}: {e}')
+        return "Error resolving the video.", 502
+    if not resolved or resolved['kind'] != 'manifest':
+        return "Manifest URL not found.", 404
+    media = media_content(resolved, youtube_id, index)
+    if media is None:
+        return "Media playlist not found.", 404
+
+    flask_response = Response(media[0], mimetype='application/vnd.apple.mpegurl')
+    flask_response.headers['Content-Type'] = 'application/vnd.apple.mpegurl; charset=utf-8'
+    flask_response.headers['Cache-Control'] = 'no-cache'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+
+def segment(youtube_id, index, number):
+    """
+    Segment of a proxied media playlist, from the segment cache. The first
+    request fetches it from YouTube, concurrent ones wait for that fetch.
+    """
+    if segment_cache is None:
+        return "Segment proxy disabled.", 404
+    try:
+        resolved = cached_resolution(youtube_id)
+    except Exception as e:
+        l.log("youtube", f'Error resolving {youtube_id}: {e}')
+        return "Error resolving the video.", 502
+    if not resolved or resolved['kind'] != 'manifest':
+        return "Manifest URL not found.", 404
+    media = media_content(resolved, youtube_id, index)
+    if media is None or number >= len(media[1]):
+        return "Segment not found.", 404
+
+    try:
+        path = segment_cache.get(f'{youtube_id}.{media[2]}.{number}', media[1][number])
+    except concurrent.futures.TimeoutError:
+        return "Timed out fetching the segment.", 504
+    if path is None:
+        return "Error fetching the segment.", 502
+    flask_response = send_file(path, mimetype=segment_mimetype(path), conditional=True)
+    flask_response.headers['Cache-Control'] = 'private, max-age=86400'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+
+def resolve_audio(youtube_id):
+    s_youtube_id = youtube_id.split('-audio')[0]
+    command = [
+        'yt-dlp',
+        '-f', 'bestaudio',
+        '--get-url',
+        '--no-warnings',
+        f'https://www.youtube.com/watch?v={s_youtube_id}'
+    ]
+    Youtube().set_cookies(command)
+    Youtube().set_proxy(command)
+    audio_url = w.worker(command).output().strip()
+    if not audio_url:
+        return None
+    return {'kind': 'redirect', 'url': audio_url, 'expire': expiry_from_url(audio_url)}
+
+def resolve(youtube_id):
+    """
+    Resolve a video (or its -audio variant), reusing the previous result
+    while its URLs are still valid. Jellyfin hits direct several times per
+    play (probe, start, seek, resume).
+    """
+    with resolved_cache_lock:
+        resolved = resolved_cache.get(youtube_id)
+    if resolved:
+        return resolved
 
-    return "Manifest URL not found or failed to redirect.", 404
+    if '-audio' in youtube_id:
+        resolved = resolve_audio(youtube_id)
+    else:
+        resolved = resolve_video(youtube_id)
+
+    if resolved and resolved['expire'] - resolve_cache_margin > time.time():
+        with resolved_cache_lock:
+            resolved_cache[youtube_id] = resolved
+    return resolved
+
+def cached_resolve(youtube_id):
+    with resolved_cache_lock:
+        return resolved_cache.get(youtube_id)
+
+def prewarm_resolve(youtube_id):
+    if cached_resolve(youtube_id):
+        return
+    resolve_flights.do(youtube_id, lambda: resolve(youtube_id), lambda: cached_resolve(youtube_id))
+    sponsor_segments(youtube_id)
+
+prewarmer = Prewarmer("youtube", prewarm_resolve, prewarm_concurrency)
+
+def prewarm(video_ids):
+    """
+    Resolve videos in the background so their first play starts from the
+    resolve cache. The cache lives in the web server process, so a scan run
+    from the command line hands the IDs over to it.
+    """
+    if hasattr(sys.modules['__main__'], 'app'):
+        prewarmer.submit(video_ids)
+        return
+    try:
+        requests.post(
+            f"http://127.0.0.1:{ytdlp2strm_config['ytdlp2strm_port']}/youtube/prewarm",
+            json=video_ids,
+            timeout=5
+        )
+    except requests.RequestException as e:
+        l.log("youtube", f'Prewarm skipped, ytdlp2STRM server not reachable: {e}')
+
+manifests_folder = os.path.join(cache_folder, source_platform, 'manifests')
+
+def manifest_file(youtube_id):
+    return os.path.join(manifests_folder, f'{sanitize(youtube_id)}.m3u8')
+
+def upstream_content(youtube_id):
+    """
+    Content of an upstream STRM: the media URL, or for HLS the URL of the
+    filtered manifest saved to cache/youtube/manifests (served as a static
+    file, the variant and audio URLs inside point to googlevideo)
+
+    Returns:
+        tuple: (content, expire), None if the video could not be resolved
+    """
+    with resolved_cache_lock:
+        resolved = resolved_cache.get(youtube_id)
+        if resolved and resolved['expire'] - upstream_refresh_margin * 2 < time.time():
+            # Valid for too short, resolve it again
+            resolved_cache.pop(youtube_id, None)
+    resolved = resolve_flights.do(youtube_id, lambda: resolve(youtube_id), lambda: cached_resolve(youtube_id))
+    if not resolved:
+        return None
+    if resolved['kind'] == 'redirect':
+        return resolved['url'], resolved['expire']
+
+    os.makedirs(manifests_folder, exist_ok=True)
+    path = manifest_file(youtube_id)
+    temp_file = f'{path}.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        file.write(served_manifest(resolved, hls_variant_policy, youtube_id, hls_segment_proxy or bool(sponsor_segments(youtube_id))))
+    os.replace(temp_file, path)
+    return f'http://{host}:{port}/{source_platform}/manifest/{youtube_id}', resolved['expire']
+
+upstream_strm = UpstreamStrm(
+    source_platform,
+    media_folder,
+    re.compile(rf'/{source_platform}/direct/([^/\s]+)\s*$'),
+    upstream_content,
+    lambda youtube_id: f'http://{host}:{port}/{source_platform}/direct/{youtube_id}',
+    hot_items=upstream_hot_items,
+    margin=upstream_refresh_margin,
+    workers=upstream_refresh_concurrency,
+    # Jellyfin/Emby only read a STRM when they scan or refresh its item
+    on_rewrite=JellyfinNotifier(config).notify_updated
+)
+if hasattr(sys.modules['__main__'], 'app'):
+    if strm_content == 'upstream':
+        upstream_strm.start()
+    elif upstream_strm.entries:
+        # Back to server: the upstream URLs would expire in a few hours
+        threading.Thread(target=upstream_strm.revert, daemon=True).start()
+
+def manifest(youtube_id, remote_addr, user_agent=None, probe=False):
+    """
+    Manifest written for an upstream STRM, without resolving anything. An
+    expired one (the STRM was not rewritten in time) falls back to direct
+    """
+    path = manifest_file(youtube_id)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            content = file.read()
+    except FileNotFoundError:
+        content = None
+    if content is None or expiry_from_url(content) - resolve_cache_margin < time.time():
+        return direct(youtube_id, remote_addr, user_agent, probe)
+
+    count("youtube", "manifest", "probe" if probe else "play", "cached")
+    if not probe:
+        upstream_strm.played(youtube_id)
+    flask_response = Response(content, mimetype='application/vnd.apple.mpegurl')
+    flask_response.headers['Content-Type'] = 'application/vnd.apple.mpegurl; charset=utf-8'
+    flask_response.headers['Cache-Control'] = 'no-cache'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    return flask_response
+
+def direct(youtube_id, remote_addr, user_agent=None, probe=False):
+    cached = cached_resolve(youtube_id)
+
+    if probe:
+        # Media server scans probe every new STRM, only playback resolves
+        if not cached:
+            count("youtube", "direct", "probe", "light")
+            mimetype = 'audio/mp4' if '-audio' in youtube_id else 'application/vnd.apple.mpegurl'
+            return light_response(request, mimetype)
+        count("youtube", "direct", "probe", "cached")
+    else:
+        count("youtube", "direct", "play", "cached" if cached else "resolved")
+        upstream_strm.played(youtube_id)
+        current_time = time.time()
+        cache_key = f"{remote_addr}_{youtube_id}"
+
+        # Check if the request is already cached
+        if cache_key not in recent_requests:
+            log_text = f'[{remote_addr}] Playing {youtube_id}'
+            l.log("youtube", log_text)
+            recent_requests[cache_key] = current_time
+
+    # Skip segments are looked up while the video resolves
+    segments = sponsorblock_executor.submit(sponsor_segments, youtube_id)
+
+    # Concurrent requests of the same video share one resolution, prewarm
+    # work waits meanwhile
+    try:
+        with prewarmer.live(), upstream_strm.live():
+            resolved = cached or resolve_flights.do(youtube_id, lambda: resolve(youtube_id), lambda: cached_resolve(youtube_id))
+    except concurrent.futures.TimeoutError:
+        l.log("youtube", f'Timed out resolving {youtube_id}')
+        return "Timed out resolving the video.", 504
+    except Exception as e:
+        l.log("youtube", f'Error resolving {youtube_id}: {e}')
+        return "Error resolving the video.", 502
+    if not resolved:
+        return "Manifest URL not found or failed to redirect.", 404
+
+    if resolved['kind'] == 'redirect':
+        # Temporary redirect, the target URL expires. Clients may reuse it
+        # until then
+        flask_response = redirect(resolved['url'], 302)
+        max_age = max(0, int(resolved['expire'] - resolve_cache_margin - time.time()))
+        flask_response.headers['Cache-Control'] = f'private, max-age={max_age}'
+        return flask_response
+
+    policy = hls.policy_for_user_agent(hls_variant_policy, hls_user_agent_policies, user_agent)
+    try:
+        proxied = hls_segment_proxy or bool(segments.result(timeout=sponsorblock_wait))
+    except concurrent.futures.TimeoutError:
+        l.log("youtube", f'SponsorBlock segments of {youtube_id} not ready, playing it uncut')
+        proxied = hls_segment_proxy
+    except Exception as e:
+        l.log("youtube", f'SponsorBlock segments of {youtube_id} not available: {e}')
+        proxied = hls_segment_proxy
+
+    # Create Response with headers optimized for VLC and media players
+    flask_response = Response(served_manifest(resolved, policy, youtube_id, proxied), mimetype='application/vnd.apple.mpegurl')
+    flask_response.headers['Content-Type'] = 'application/vnd.apple.mpegurl; charset=utf-8'
+    flask_response.headers['Content-Disposition'] = 'inline; filename="index.m3u8"'
+    flask_response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+    flask_response.headers['Pragma'] = 'no-cache'
+    flask_response.headers['Expires'] = '0'
+    flask_response.headers['Accept-Ranges'] = 'bytes'
+    flask_response.headers['Access-Control-Allow-Origin'] = '*'
+    flask_response.headers['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+    flask_response.headers['Access-Control-Allow-Headers'] = 'Range'
+    
+    return flask_response
     
-def bridge(youtube_id):
+def bridge(youtube_id, probe=False):
+    if probe:
+        count("youtube", "bridge", "probe", "light")
+        return light_response(request, "video/mp4")
+    count("youtube", "bridge", "play", "resolved")
     s_youtube_id = youtube_id.split('-audio')[0]
     s_youtube_id = f'https://www.youtube.com/watch?v={s_youtube_id}'
+    if sponsorblock and sponsorblock_mode == 'manifest' and '-audio' not in youtube_id:
+        # Remux the direct playlist, already without the segments, so the
+        # first bytes come as soon as the video resolves
+        def generate():
+            command = ['ffmpeg', '-loglevel', 'error', '-i', f"http://127.0.0.1:{ytdlp2strm_config['ytdlp2strm_port']}/{source_platform}/direct/{youtube_id}", '-c', 'copy', '-f', 'mpegts', 'pipe:1']
+            yield from w.worker(command).buffered()
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype = "video/mp2t"
+        )
+
     def generate():
-        startTime = time.time()
-        buffer = []
-        sentBurst = False
-        if config["sponsorblock"]:
+        if sponsorblock:
             command = ['yt-dlp', '--no-warnings', '-o', '-', '-f', 'bestvideo+bestaudio', '--sponsorblock-remove',  config['sponsorblock_cats'], '--restrict-filenames', s_youtube_id]
         else:
             command = ['yt-dlp', '--no-warnings', '-o', '-', '-f', 'best', '--restrict-filenames', s_youtube_id]
@@ -975,64 +1316,83 @@ def bridge(youtube_id):
         Youtube().set_proxy(command)
         if '-audio' in youtube_id:
             command[5] = 'bestaudio'
-        
-
-        #process = w.worker(command).pipe()
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
-        time.sleep(3)
-        try:
-
-            while True:
-                # Get some data from ffmpeg
-                #time.sleep(0.1)  # Espera brevemente por más datos
-                line = process.stdout.read(1024)
-                
-                if not line:
-                    break
-                # We buffer everything before outputting it
-                buffer.append(line)
-
-                # Minimum buffer time, 3 seconds
-                if sentBurst is False and time.time() > startTime + 3 and len(buffer) > 0:
-                    sentBurst = True
-
-                    for i in range(0, len(buffer) - 2):
-                        yield buffer.pop(0)
 
-                elif time.time() > startTime + 3 and len(buffer) > 0:
-                    yield buffer.pop(0)
-
-                process.poll()
-        finally:
-            process.kill()
+        # Prebuffered and bounded, the process is killed as soon as the
+        # client goes away
+        yield from w.worker(command).buffered()
 
     return Response(
         stream_with_context(generate()), 
         mimetype = "video/mp4"
     ) 
 
-def download(youtube_id):
+def download(youtube_id, probe=False):
     s_youtube_id = youtube_id.split('-audio')[0]
-    current_dir = os.getcwd()
+    variant = 'audio' if '-audio' in youtube_id else 'video'
+    if sponsorblock:
+        variant = f'{variant}-sponsorblock'
+    temp_media = TempMedia.shared()
+
+    # Files left by a process that could not record them are found by
+    # their deterministic name
+    extensions = ('m4a', 'webm', 'ogg') if variant == 'audio' else ('mkv',) if variant == 'video' else ('mkv', 'mp4', 'webm', 'm4a', 'opus')
+    cached = temp_media.lookup('youtube', s_youtube_id, variant, extensions)
+    if cached:
+        count("youtube", "download", "probe" if probe else "play", "cached")
+        return send_file(cached, conditional=True)
+    if probe and not ProgressiveDownload.running(youtube_id):
+        # Don't start a download for a probe
+        count("youtube", "download", "probe", "light")
+        return light_response(request, 'audio/mp4' if variant.startswith('audio') else 'video/x-matroska')
+    count("youtube", "download", "probe" if probe else "play", "resolved")
+
+    os.makedirs(temp_folder, exist_ok=True)
+    if sponsorblock:
+        # Removing the segments needs the whole file, download it first.
+        # The extension is chosen by yt-dlp, it prints the final path
+        output = temp_media.path('youtube', s_youtube_id, variant) + '.%(ext)s'
+        command = ['yt-dlp', '--no-warnings', '-f', 'bv*+ba+ba.2', '-o', output, '--sponsorblock-remove',  config['sponsorblock_cats'], '--print', 'after_move:filepath', '--no-simulate', s_youtube_id]
+        Youtube().set_cookies(command)
+        Youtube().set_language(command)
+        Youtube().set_proxy(command)
+        if variant.startswith('audio'):
+            command[3] = 'bestaudio'
 
-    # Construyes la ruta hacia la carpeta 'temp' dentro del directorio actual
-    temp_dir = os.path.join(current_dir, 'temp')
-    if config["sponsorblock"]:
-        command = ['yt-dlp', '-f', 'bv*+ba+ba.2', '-o',  os.path.join(temp_dir, '%(title)s.%(ext)s'), '--sponsorblock-remove',  config['sponsorblock_cats'], '--restrict-filenames', s_youtube_id]
+        try:
+            filepath = w.worker(command).output().strip().splitlines()
+        except Exception as e:
+            l.log("youtube", f"Error downloading {youtube_id}: {e}")
+            filepath = None
+        if not filepath or not os.path.isfile(filepath[-1]):
+            l.log("youtube", f"Download of {youtube_id} failed")
+            # Same answer as a failed progressive download
+            return Response("Download failed.", status=502)
+        temp_media.record('youtube', s_youtube_id, variant, filepath[-1])
+        return send_file(filepath[-1], conditional=True)
+
+    # Merged output goes to stdout and is written to temp/ as it arrives,
+    # so playback starts with the first fragments
+    sniff = None
+    if variant == 'audio':
+        command = ['yt-dlp', '--no-warnings', '-f', 'bestaudio[ext=m4a]/bestaudio', '-o', '-', s_youtube_id]
+        final_path = temp_media.path('youtube', s_youtube_id, variant, 'm4a')
+        mimetype = 'audio/mp4'
+        # The fallback format may be opus in webm, the postprocessors that
+        # could remux it don't run for stdout: the file is named after the
+        # container it starts with
+        sniff = sniff_audio
     else:
-        command = ['yt-dlp', '-f', 'bv*+ba+ba.2', '-o',  os.path.join(temp_dir, '%(title)s.%(ext)s'), '--restrict-filenames', s_youtube_id]
+        command = ['yt-dlp', '--no-warnings', '-f', 'bv*+ba+ba.2', '--merge-output-format', 'mkv', '-o', '-', s_youtube_id]
+        final_path = temp_media.path('youtube', s_youtube_id, variant, 'mkv')
+        mimetype = 'video/x-matroska'
     Youtube().set_cookies(command)
     Youtube().set_language(command)
     Youtube().set_proxy(command)
-    if '-audio' in youtube_id:
-        command[2] = 'bestaudio'
 
-    w.worker(command).call()
-    
-    filename_command = ['yt-dlp', '--print', 'filename', '--restrict-filenames', "{}".format(youtube_id)]
-    Youtube().set_cookies(filename_command)
-    Youtube().set_language(filename_command)
-    filename = w.worker(filename_command).output()
-    return send_file(
-        os.path.join(temp_dir, filename)
-    )
\ No newline at end of file
+    return ProgressiveDownload.get(
+        youtube_id, command, final_path,
+        on_finished=lambda path: temp_media.record('youtube', s_youtube_id, variant, path),
+        # mkv written to a pipe has no cues, remuxed once finished
+        remux=variant == 'video',
+        sniff=sniff
+    ).response(request, mimetype)
\ No newline at end of file
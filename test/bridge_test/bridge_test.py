@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import subprocess
+
+# Run from the repository root: python test/bridge_test/bridge_test.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from clases.stream_buffer.stream_buffer import StreamBuffer
+
+MEGABYTES = 32
+
+# Stands in for yt-dlp -o -: writes MEGABYTES of data to stdout as fast as
+# the pipe accepts it
+PRODUCER = [
+    sys.executable, '-c',
+    'import sys\n'
+    'block = b"x" * 65536\n'
+    f'for _ in range({MEGABYTES} * 16):\n'
+    '    sys.stdout.buffer.write(block)\n'
+]
+
+def start_producer():
+    return subprocess.Popen(PRODUCER, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+def legacy_generate(process):
+    # bridge() before the stream buffer: fixed 3 s sleep, 1 KB reads and a
+    # list drained with pop(0)
+    startTime = time.time()
+    buffer = []
+    sentBurst = False
+    time.sleep(3)
+    try:
+        while True:
+            line = process.stdout.read(1024)
+            if not line:
+                break
+            buffer.append(line)
+            if sentBurst is False and time.time() > startTime + 3 and len(buffer) > 0:
+                sentBurst = True
+                for i in range(0, len(buffer) - 2):
+                    yield buffer.pop(0)
+            elif time.time() > startTime + 3 and len(buffer) > 0:
+                yield buffer.pop(0)
+            process.poll()
+    finally:
+        process.kill()
+
+def measure(label, generator):
+    start = time.perf_counter()
+    first_byte = None
+    total = 0
+    for chunk in generator:
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+    elapsed = time.perf_counter() - start
+    print(f'{label:<28} first byte {first_byte * 1000:8.1f} ms   {total / elapsed / 1048576:8.1f} MB/s   {total / 1048576:.0f} MB')
+
+def backpressure():
+    # Slow client: the buffer must stay bounded while the producer waits
+    buffer = StreamBuffer(start_producer(), chunk_size=65536, max_chunks=32, prebuffer_bytes=0, prebuffer_seconds=0)
+    generator = buffer.generate()
+    peak = 0
+    for i, chunk in enumerate(generator):
+        peak = max(peak, buffer.queue.qsize())
+        if i == 50:
+            break
+        time.sleep(0.01)
+    print(f'{"slow client":<28} peak buffered {peak * 65536 / 1048576:.1f} MB (limit {32 * 65536 / 1048576:.1f} MB)')
+    return buffer, generator
+
+def disconnect(buffer, generator):
+    start = time.perf_counter()
+    generator.close()
+    print(f'{"client disconnect":<28} producer exit code {buffer.process.poll()} after {(time.perf_counter() - start) * 1000:.1f} ms')
+
+measure('legacy bridge', legacy_generate(start_producer()))
+measure('stream buffer (defaults)', StreamBuffer(start_producer()).generate())
+measure('stream buffer (no prebuffer)', StreamBuffer(start_producer(), prebuffer_bytes=0, prebuffer_seconds=0).generate())
+disconnect(*backpressure())
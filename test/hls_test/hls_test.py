@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+
+# Run from anywhere: python test/hls_test/hls_test.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from utils import hls
+
+def youtube_like_master():
+    """
+    Master playlist shaped like the YouTube ones: two audio groups (233 and
+    234) and every video variant listed once per audio group.
+    """
+    lines = ['#EXTM3U', '#EXT-X-INDEPENDENT-SEGMENTS']
+    for group in ['233', '234']:
+        for language in ['en', 'es', 'fr']:
+            lines.append(
+                f'#EXT-X-MEDIA:URI="https://manifest.googlevideo.com/api/manifest/hls_playlist/expire/1999999999/itag/{group}/lang/{language}/index.m3u8",'
+                f'TYPE=AUDIO,GROUP-ID="{group}",LANGUAGE="{language}",NAME="{language}",DEFAULT=NO,AUTOSELECT=YES'
+            )
+    heights = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+    for group, audio_bandwidth in [('233', 48000), ('234', 128000)]:
+        for height in heights:
+            width = height * 16 // 9
+            bandwidth = height * 4000 + audio_bandwidth
+            lines.append(
+                f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},CODECS="avc1.4d401e,mp4a.40.2",'
+                f'RESOLUTION={width}x{height},FRAME-RATE=30,VIDEO-RANGE=SDR,AUDIO="{group}",CLOSED-CAPTIONS=NONE'
+            )
+            lines.append(f'https://manifest.googlevideo.com/api/manifest/hls_playlist/expire/1999999999/itag/{height}/aud/{group}/index.m3u8')
+    return '\n'.join(lines) + '\n'
+
+def measure(label, function, iterations=2000):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<40} {elapsed / iterations * 1000000:8.1f} us/call')
+
+master = youtube_like_master()
+
+for policy in ['best', 'height<=1080', 'bandwidth<=3000000']:
+    print(f'--- {policy}')
+    print(hls.filter_master(master, policy, 279001))
+
+measure('parse_master', lambda: hls.parse_master(master))
+measure('filter_master best', lambda: hls.filter_master(master, 'best', 279001))
+measure('filter_master height<=1080', lambda: hls.filter_master(master, 'height<=1080', 279001))
+filtered = {}
+measure('cached (video, policy) lookup', lambda: filtered.get('best') or filtered.setdefault('best', hls.filter_master(master, 'best', 279001)))
+
+def media_playlist(duration, count, name='v'):
+    """VOD media playlist with fMP4 segments of one duration, each URI named by its start time"""
+    lines = ['#EXTM3U', '#EXT-X-VERSION:7', f'#EXT-X-TARGETDURATION:{int(duration)}', '#EXT-X-PLAYLIST-TYPE:VOD',
+             f'#EXT-X-MAP:URI="{name}/init.mp4"']
+    for number in range(count):
+        lines.append(f'#EXTINF:{duration:.3f},')
+        lines.append(f'{name}/{number * duration:g}.mp4')
+    lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+def kept_starts(content):
+    """Start times of the segments left, and the start time after each discontinuity"""
+    header, segments, footer = hls.parse_media(content)
+    starts = [float(segment.uri.rsplit('/', 1)[1][:-4]) for segment in segments]
+    jumps = [start for start, segment in zip(starts, segments) if '#EXT-X-DISCONTINUITY' in segment.tags]
+    return starts, jumps, segments, footer
+
+print('--- remove_ranges')
+base = 'https://example.com/hls/'
+
+# Leading cut: no discontinuity before the first segment, #EXT-X-MAP carried over
+content = hls.remove_ranges(media_playlist(5, 20), [(0, 12)], base)
+starts, jumps, segments, footer = kept_starts(content)
+assert starts[0] == 10 and jumps == [], (starts, jumps)
+assert segments[0].tags[0] == '#EXT-X-MAP:URI="https://example.com/hls/v/init.mp4"', segments[0].tags
+assert footer == ['#EXT-X-ENDLIST']
+print('leading cut ok    ', starts[:3], jumps)
+
+# Trailing cut: nothing after the jump, no dangling discontinuity
+content = hls.remove_ranges(media_playlist(5, 20), [(88, 100)])
+starts, jumps, segments, footer = kept_starts(content)
+assert starts[-1] == 85 and jumps == [] and footer == ['#EXT-X-ENDLIST'], (starts, jumps, footer)
+print('trailing cut ok   ', starts[-3:], jumps)
+
+# A new #EXT-X-MAP inside a cut applies to the first segment after it
+playlist = media_playlist(5, 20).replace('#EXTINF:5.000,\nv/25.mp4', '#EXT-X-MAP:URI="v/init2.mp4"\n#EXTINF:5.000,\nv/25.mp4')
+content = hls.remove_ranges(playlist, [(24, 36)])
+starts, jumps, segments, footer = kept_starts(content)
+after = segments[starts.index(35)]
+assert jumps == [35] and after.tags[:2] == ['#EXT-X-DISCONTINUITY', '#EXT-X-MAP:URI="v/init2.mp4"'], after.tags
+print('map carry-over ok ', after.tags[:2])
+
+# Video and audio with different segment durations: same number of
+# discontinuities, cut points within half a segment of each other
+ranges = [(31, 47), (60, 62.5), (65, 70), (118, 140)]
+video = hls.remove_ranges(media_playlist(2, 70, 'video'), ranges)
+audio = hls.remove_ranges(media_playlist(6, 24, 'audio'), ranges)
+video_starts, video_jumps, _, _ = kept_starts(video)
+audio_starts, audio_jumps, _, _ = kept_starts(audio)
+assert len(video_jumps) == len(audio_jumps), (video_jumps, audio_jumps)
+for video_jump, audio_jump in zip(video_jumps, audio_jumps):
+    assert abs(video_jump - audio_jump) <= 3, (video_jumps, audio_jumps)
+removed_video = 140 - 2 * len(video_starts)
+removed_audio = 144 - 6 * len(audio_starts)
+assert abs(removed_video - removed_audio) <= 6, (removed_video, removed_audio)
+print('video/audio ok    ', 'jumps', video_jumps, audio_jumps, 'removed', removed_video, removed_audio)
+
+measure('remove_ranges (4 ranges, 70 segments)', lambda: hls.remove_ranges(media_playlist(2, 70), ranges), 500)
@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Run from the repository root: python test/segment_cache_test/segment_cache_test.py
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from clases.segment_cache.segment_cache import SegmentCache
+
+SEGMENTS = 20
+SEGMENT_SIZE = 1024 * 1024
+CLIENTS = 4
+# Stands in for the WAN: time to first byte and bytes/s of the origin
+LATENCY = 0.08
+BANDWIDTH = 50 * 1024 * 1024
+
+class FakeOrigin(BaseHTTPRequestHandler):
+    """googlevideo stand-in: /seg/<n>.ts answers SEGMENT_SIZE bytes slowly"""
+    requests = 0
+    bytes_sent = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with FakeOrigin.lock:
+            FakeOrigin.requests += 1
+            FakeOrigin.bytes_sent += SEGMENT_SIZE
+        time.sleep(LATENCY)
+        number = int(self.path.rsplit('/', 1)[1].split('.')[0])
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp2t')
+        self.send_header('Content-Length', str(SEGMENT_SIZE))
+        self.end_headers()
+        block = bytes([0x47, number % 256]) * (64 * 1024)
+        for offset in range(0, SEGMENT_SIZE, len(block)):
+            self.wfile.write(block)
+            time.sleep(len(block) / BANDWIDTH)
+
+    def log_message(self, *args):
+        pass
+
+def start_origin():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOrigin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def reset_origin():
+    FakeOrigin.requests = 0
+    FakeOrigin.bytes_sent = 0
+
+def play(cache, origin, numbers):
+    # One client reading segments in order, returns seconds per segment
+    timings = []
+    for number in numbers:
+        start = time.perf_counter()
+        path = cache.get(f'video.itag-1080.{number}', f'{origin}/seg/{number}.ts')
+        with open(path, 'rb') as file:
+            assert file.read(2) == bytes([0x47, number % 256])
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def report(label, timings, elapsed):
+    timings = sorted(timings)
+    print(f'{label:<36} {elapsed:6.2f} s total, segment median {timings[len(timings) // 2] * 1000:7.1f} ms, '
+          f'origin requests {FakeOrigin.requests:3}, origin MB {FakeOrigin.bytes_sent / 1048576:6.1f}')
+
+def direct_fetch(origin, numbers):
+    # No proxy: every client downloads every segment itself
+    import requests
+    session = requests.Session()
+    timings = []
+    for number in numbers:
+        start = time.perf_counter()
+        session.get(f'{origin}/seg/{number}.ts').content
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def run_clients(function, *args):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CLIENTS) as executor:
+        results = list(executor.map(lambda _: function(*args), range(CLIENTS)))
+    return [timing for result in results for timing in result], time.perf_counter() - start
+
+server, origin = start_origin()
+folder = tempfile.mkdtemp(prefix='segment_cache_test_')
+numbers = list(range(SEGMENTS))
+try:
+    print(f'{CLIENTS} clients watching the same {SEGMENTS} segments of {SEGMENT_SIZE // 1024} KB')
+
+    reset_origin()
+    timings, elapsed = run_clients(direct_fetch, origin, numbers)
+    report('without proxy', timings, elapsed)
+
+    cache = SegmentCache('test', folder, 64 * 1024 * 1024)
+    reset_origin()
+    timings, elapsed = run_clients(play, cache, origin, numbers)
+    report('proxy, cold cache', timings, elapsed)
+    assert FakeOrigin.requests == SEGMENTS, 'concurrent fetches of a segment were not shared'
+
+    reset_origin()
+    seeks = [5, 6, 7, 2, 3, 15, 16, 0, 1]
+    start = time.perf_counter()
+    timings = play(cache, origin, seeks)
+    report('proxy, seeking back and forth', timings, time.perf_counter() - start)
+    assert FakeOrigin.requests == 0, 'cached segments were fetched again'
+
+    # Budget of 8 segments: the least recently used ones are deleted
+    small = SegmentCache('test', tempfile.mkdtemp(dir=folder), 8 * SEGMENT_SIZE)
+    play(small, origin, numbers)
+    # 12 is the oldest one, used again it outlives 13
+    play(small, origin, [12, 0])
+    cached = sorted(small.entries)
+    assert small.size <= 8 * SEGMENT_SIZE and len(cached) == 8, cached
+    assert 'video.itag-1080.12' in cached and 'video.itag-1080.13' not in cached, cached
+    print(f'LRU budget of 8 segments keeps {", ".join(cached)}')
+
+    # A new process starts from the segments left on disk
+    reloaded = SegmentCache('test', small.folder, 8 * SEGMENT_SIZE)
+    assert sorted(reloaded.entries) == cached and reloaded.size == small.size
+    print('Reloaded from disk with the same segments')
+finally:
+    server.shutdown()
+    shutil.rmtree(folder, ignore_errors=True)
@@ -1,10 +1,12 @@
 from __main__ import app
-from flask import request, render_template, session, send_from_directory, jsonify
+from flask import request, render_template, session, send_from_directory, jsonify, Response
 from flask_socketio import SocketIO
 import json
 import logging
 from clases.worker import worker as w
 from ui.ui import Ui
+from clases.channel_cache.channel_cache import ChannelCache
+from clases.metrics.metrics import Metrics
 _ui = Ui()
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 logging.getLogger('werkzeug').setLevel(logging.WARNING)
@@ -142,6 +144,21 @@ def plugin(plugin):
         request=request.method
     )
 
+# Fuerza la recarga de los metadatos de los canales en el siguiente escaneo
+@app.route('/plugin/<plugin>/refresh_metadata', methods=['POST'])
+def plugin_refresh_metadata(plugin):
+    plugins = _ui.plugins
+    selected_plugin = list(filter(lambda p: p['name'] == plugin, plugins))
+    ChannelCache.for_plugin(selected_plugin[0]['name']).clear()
+
+    return render_template(
+        'plugin_settings.html',
+        plugin=selected_plugin[0],
+        result=False,
+        refreshed=True,
+        request=None
+    )
+
 # Ruta para editar config y channels un plugin
 @app.route('/plugin/<plugin>/channels', methods=['GET', 'POST'])
 def plugin_channels(plugin):
@@ -174,6 +191,11 @@ def plugin_channels(plugin):
         request=request.method
     )
 
+@app.route('/metrics')
+def metrics():
+    # Prometheus text format: probe vs play requests of the STRM URLs
+    return Response(Metrics.shared().render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/log')
 def view_log():
     log_file = 'ytdlp2strm.log'
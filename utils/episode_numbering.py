@@ -1,11 +1,11 @@
-import os
-import re
 from datetime import datetime
+from clases.episode_allocator.episode_allocator import EpisodeAllocator, get_max_episode_number
 
 def get_next_episode_number(folder_path: str, year: int) -> str:
     """
     Get the next episode number for the given year by scanning existing files
-    and finding the highest episode number.
+    and finding the highest episode number. It does not reserve the number,
+    use EpisodeAllocator for that.
     
     Args:
         folder_path: The folder to scan for existing episodes
@@ -14,20 +14,7 @@ def get_next_episode_number(folder_path: str, year: int) -> str:
     Returns:
         A two-digit string episode number (e.g. "01", "02", etc)
     """
-    pattern = rf"S{year}E(\d+)"
-    max_episode = 0
-    
-    # Walk through all files in the directory
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith(".strm"):
-                match = re.search(pattern, file)
-                if match:
-                    episode_num = int(match.group(1))
-                    max_episode = max(max_episode, episode_num)
-    
-    # Return next episode number as 2-digit string
-    return f"{max_episode + 1:02d}"
+    return f"{get_max_episode_number(folder_path, year) + 1:02d}"
 
 def get_episode_number_from_date(upload_date: str, use_mmdd: bool = False) -> str:
     """
@@ -62,7 +49,7 @@ def format_episode_title(title: str, folder_path: str, upload_date: str = None,
     
     Args:
         title: The original title
-        folder_path: Path to check for existing episode numbers
+        folder_path: Season folder the episode number is allocated in
         upload_date: Upload date (YYYY-MM-DD or YYYYMMDD) - required if use_mmdd is True
         use_mmdd: If True, use MMDD as episode number instead of sequential
         
@@ -84,6 +71,7 @@ def format_episode_title(title: str, folder_path: str, upload_date: str = None,
             year = current_year
         return f"S{year}E{episode_number} - {title}"
     else:
-        # Use sequential numbering
-        next_episode = get_next_episode_number(folder_path, current_year)
-        return f"S{current_year}E{next_episode} - {title}"
+        # Use sequential numbering, the number is reserved so every call
+        # (and every concurrent run) gets a different one
+        next_episode = EpisodeAllocator.shared().allocate(folder_path, current_year)
+        return f"S{current_year}E{next_episode:02d} - {title}"
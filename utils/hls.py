@@ -0,0 +1,441 @@
+"""
+HLS master playlist parsing, variant selection and serialization.
+
+Used by the direct modes to serve a master playlist reduced to one video
+variant (plus the audio renditions it references) chosen by a policy:
+- best                  highest bandwidth
+- height<=1080          best variant up to that resolution height
+- bandwidth<=5000000    best variant up to that bitrate (bits/s)
+
+Media playlists can be rewritten to leave out time ranges (SponsorBlock).
+"""
+import re
+import bisect
+import requests
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+
+# KEY=value or KEY="quoted, value" pairs of an attribute list
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+POLICY_PATTERN = re.compile(r'^(height|bandwidth)\s*<=\s*(\d+)$')
+# /itag/234/, /lang/en/... path parameters of a YouTube media playlist URL
+RENDITION_PATTERN = re.compile(r'/(itag|lang|xtags)/([^/?]+)')
+
+# Keep-alive connections to the manifest hosts, shared by every request
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+class Variant:
+    """#EXT-X-STREAM-INF entry: its attributes and URI"""
+    __slots__ = ('attributes', 'uri', 'bandwidth', 'height')
+
+    def __init__(self, attributes: dict, uri: str):
+        self.attributes = attributes
+        self.uri = uri
+        self.bandwidth = int(attributes.get('BANDWIDTH', 0) or 0)
+        resolution = attributes.get('RESOLUTION', '')
+        try:
+            self.height = int(resolution.split('x')[1])
+        except (IndexError, ValueError):
+            self.height = 0
+
+
+class MasterPlaylist:
+    """
+    Parsed master playlist.
+
+    tags: header tags kept as they are (#EXTM3U, #EXT-X-INDEPENDENT-SEGMENTS...)
+    media: attribute dicts of the #EXT-X-MEDIA renditions
+    variants: Variant list, in playlist order
+    """
+    __slots__ = ('tags', 'media', 'variants')
+
+    def __init__(self):
+        self.tags = []
+        self.media = []
+        self.variants = []
+
+
+def parse_attributes(text: str) -> dict:
+    """
+    Parse an attribute list (BANDWIDTH=1,CODECS="a,b") keeping the order and
+    the quotes of the values, so it can be written back unchanged.
+    """
+    return {key: value for key, value in ATTRIBUTE_PATTERN.findall(text)}
+
+
+def format_attributes(attributes: dict) -> str:
+    return ','.join(f'{key}={value}' for key, value in attributes.items())
+
+
+def parse_master(content: str) -> MasterPlaylist:
+    """
+    Parse a master playlist.
+
+    Args:
+        content: Playlist text
+
+    Returns:
+        MasterPlaylist
+    """
+    playlist = MasterPlaylist()
+    pending = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending = parse_attributes(line[len('#EXT-X-STREAM-INF:'):])
+        elif line.startswith('#EXT-X-MEDIA:'):
+            playlist.media.append(parse_attributes(line[len('#EXT-X-MEDIA:'):]))
+        elif line.startswith('#'):
+            if line not in playlist.tags:
+                playlist.tags.append(line)
+        elif pending is not None:
+            # URI line of the previous #EXT-X-STREAM-INF
+            playlist.variants.append(Variant(pending, line))
+            pending = None
+    return playlist
+
+
+def serialize_master(playlist: MasterPlaylist) -> str:
+    """
+    Write a master playlist back to text.
+    """
+    lines = list(playlist.tags) or ['#EXTM3U']
+    lines.extend(f'#EXT-X-MEDIA:{format_attributes(media)}' for media in playlist.media)
+    for variant in playlist.variants:
+        lines.append(f'#EXT-X-STREAM-INF:{format_attributes(variant.attributes)}')
+        lines.append(variant.uri)
+    return '\n'.join(lines) + '\n'
+
+
+def master_uris(content: str) -> list:
+    """
+    URIs of the renditions (#EXT-X-MEDIA) and variants of a master playlist,
+    in playlist order. The index of a URI in this list is stable for the
+    same master, so it can name the rendition in proxied URLs.
+    """
+    playlist = parse_master(content)
+    uris = [media['URI'].strip('"') for media in playlist.media if 'URI' in media]
+    uris.extend(variant.uri for variant in playlist.variants)
+    return uris
+
+
+def rendition_id(url: str) -> str:
+    """
+    Name of the rendition a YouTube media playlist URL serves: its itag,
+    plus lang and xtags for the audio tracks. Unlike the position in the
+    master it doesn't depend on the audio groups listing it, nor change
+    between resolutions of the video.
+
+    Returns:
+        e.g. "itag-234.lang-en", None if the URL has no itag
+    """
+    parameters = dict(RENDITION_PATTERN.findall(url))
+    if 'itag' not in parameters:
+        return None
+    return '.'.join(f'{name}-{parameters[name]}' for name in ('itag', 'lang', 'xtags') if name in parameters)
+
+
+def rewrite_master(content: str, rewrite) -> str:
+    """
+    Replace every rendition and variant URI of a master playlist.
+
+    Args:
+        content: Master playlist text
+        rewrite: Called with each URI, returns the new one
+    """
+    playlist = parse_master(content)
+    for media in playlist.media:
+        if 'URI' in media:
+            media['URI'] = '"{}"'.format(rewrite(media['URI'].strip('"')))
+    for variant in playlist.variants:
+        variant.uri = rewrite(variant.uri)
+    return serialize_master(playlist)
+
+
+class Segment:
+    """Media segment: the tags before its URI, duration and URI"""
+    __slots__ = ('tags', 'duration', 'uri')
+
+    def __init__(self, tags: list, duration: float, uri: str):
+        self.tags = tags
+        self.duration = duration
+        self.uri = uri
+
+
+# Tags that apply to every following segment, kept when a segment is removed
+PERSISTENT_TAGS = ('#EXT-X-MAP:', '#EXT-X-KEY:')
+# Ranges closer than this (seconds) are cut as one, so renditions with
+# longer segments don't fold two cuts into one discontinuity
+MERGE_GAP = 10.0
+
+
+def parse_media(content: str, base_url: str = None):
+    """
+    Parse a media playlist.
+
+    Args:
+        content: Playlist text
+        base_url: URL of the playlist, relative segment (and #EXT-X-MAP,
+            #EXT-X-KEY) URIs are made absolute with it
+
+    Returns:
+        (header, segments, footer): header and footer tag lines, Segment list
+    """
+    header, segments, footer = [], [], []
+    pending = []
+    duration = None
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#EXTINF:'):
+            try:
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            except ValueError:
+                duration = 0.0
+            pending.append(line)
+        elif line.startswith('#'):
+            if base_url and line.startswith(PERSISTENT_TAGS):
+                line = rewrite_tag_uri(line, lambda uri: uri, base_url)
+            if line.startswith('#EXT-X-ENDLIST'):
+                footer.append(line)
+            elif not segments and duration is None and not line.startswith(PERSISTENT_TAGS) \
+                    and not line.startswith('#EXT-X-BYTERANGE') and not line.startswith('#EXT-X-DISCONTINUITY'):
+                header.append(line)
+            else:
+                pending.append(line)
+        else:
+            uri = urljoin(base_url, line) if base_url else line
+            segments.append(Segment(pending, duration or 0.0, uri))
+            pending = []
+            duration = None
+    return header, segments, footer
+
+
+def serialize_media(header: list, segments: list, footer: list) -> str:
+    lines = list(header) or ['#EXTM3U']
+    for segment in segments:
+        lines.extend(segment.tags)
+        lines.append(segment.uri)
+    lines.extend(footer)
+    return '\n'.join(lines) + '\n'
+
+
+def merge_ranges(ranges: list, gap: float = MERGE_GAP) -> list:
+    """Sort (start, end) ranges and join the ones less than gap apart"""
+    merged = []
+    for start, end in sorted((float(start), float(end)) for start, end in ranges):
+        if end <= start:
+            continue
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def nearest_boundary(boundaries: list, time: float) -> int:
+    """Index of the segment boundary closest to a time, the earlier on a tie"""
+    index = bisect.bisect_left(boundaries, time)
+    if index == 0:
+        return 0
+    if index == len(boundaries):
+        return index - 1
+    return index if boundaries[index] - time < time - boundaries[index - 1] else index - 1
+
+
+def remove_ranges(content: str, ranges: list, base_url: str = None) -> str:
+    """
+    Leave time ranges out of a media playlist, with a discontinuity where
+    the timeline jumps.
+
+    Every range is cut from the segment boundary nearest to its start to
+    the one nearest to its end. The video and audio playlists are cut by
+    that same rule, so their cut points are at most half a segment away
+    from the range and from each other, and each range adds exactly one
+    discontinuity to both (even where it is too short to remove a segment),
+    which keeps their discontinuity sequences in step.
+
+    Args:
+        content: Media playlist text
+        ranges: (start, end) seconds to remove
+        base_url: URL of the playlist, to make the segment URIs absolute
+
+    Returns:
+        Rewritten media playlist text
+    """
+    header, segments, footer = parse_media(content, base_url)
+    boundaries = [0.0]
+    for segment in segments:
+        boundaries.append(boundaries[-1] + segment.duration)
+
+    cut_starts = set()
+    removed = set()
+    total = boundaries[-1]
+    for start, end in merge_ranges(ranges):
+        # Less than MERGE_GAP before or after the range is cut with it, the
+        # renditions don't end at exactly the same time
+        if start < MERGE_GAP:
+            start = 0.0
+        if total - end < MERGE_GAP:
+            end = total
+        first = nearest_boundary(boundaries, start)
+        last = max(first, nearest_boundary(boundaries, end))
+        cut_starts.add(first)
+        removed.update(range(first, last))
+
+    kept = []
+    persistent = []
+    jump = False
+    for index, segment in enumerate(segments):
+        if index in cut_starts:
+            jump = True
+        if index in removed:
+            # Its #EXT-X-MAP/#EXT-X-KEY still apply to the next segments
+            persistent.extend(tag for tag in segment.tags if tag.startswith(PERSISTENT_TAGS))
+            continue
+        tags = persistent + segment.tags
+        persistent = []
+        if jump and kept and '#EXT-X-DISCONTINUITY' not in tags:
+            tags.insert(0, '#EXT-X-DISCONTINUITY')
+        jump = False
+        kept.append(Segment(tags, segment.duration, segment.uri))
+    return serialize_media(header, kept, footer)
+
+
+def rewrite_segments(content: str, rewrite, base_url: str = None) -> str:
+    """
+    Replace every segment URI (and #EXT-X-MAP URI) of a media playlist.
+
+    Args:
+        content: Media playlist text
+        rewrite: Called with each absolute URI, returns the new one
+        base_url: URL of the playlist, to make the URIs absolute
+    """
+    header, segments, footer = parse_media(content, base_url)
+    for segment in segments:
+        segment.tags = [
+            rewrite_tag_uri(tag, rewrite) if tag.startswith('#EXT-X-MAP:') else tag
+            for tag in segment.tags
+        ]
+        segment.uri = rewrite(segment.uri)
+    return serialize_media(header, segments, footer)
+
+
+def rewrite_tag_uri(tag: str, rewrite, base_url: str = None) -> str:
+    """Replace the URI attribute of a tag (#EXT-X-MAP, #EXT-X-KEY)"""
+    name, _, text = tag.partition(':')
+    attributes = parse_attributes(text)
+    if 'URI' not in attributes:
+        return tag
+    uri = attributes['URI'].strip('"')
+    attributes['URI'] = '"{}"'.format(rewrite(urljoin(base_url, uri) if base_url else uri))
+    return f'{name}:{format_attributes(attributes)}'
+
+
+def parse_policy(policy: str):
+    """
+    Parse a variant policy string.
+
+    Args:
+        policy: best, height<=N or bandwidth<=N
+
+    Returns:
+        (field, limit) tuple, (None, None) for best or an unknown policy
+    """
+    match = POLICY_PATTERN.match((policy or '').strip().lower())
+    if not match:
+        return None, None
+    return match.group(1), int(match.group(2))
+
+
+def policy_for_user_agent(default_policy: str, user_agent_policies: str, user_agent: str) -> str:
+    """
+    Pick the policy of a client.
+
+    Args:
+        default_policy: Policy when no rule matches
+        user_agent_policies: Rules as "substring:policy;substring:policy",
+            e.g. "Roku:height<=720;AndroidTV:bandwidth<=8000000"
+        user_agent: User-Agent header of the request
+
+    Returns:
+        The policy of the first rule whose substring is in the User-Agent
+    """
+    if user_agent and user_agent_policies:
+        for rule in user_agent_policies.split(';'):
+            if ':' not in rule:
+                continue
+            substring, policy = rule.rsplit(':', 1)
+            if substring.strip() and substring.strip().lower() in user_agent.lower():
+                return policy.strip()
+    return default_policy
+
+
+def select_variant(variants: list, policy: str):
+    """
+    Choose the variant of a policy: the highest bandwidth among the variants
+    inside the cap, or the smallest one if none fits.
+    """
+    if not variants:
+        return None
+    field, limit = parse_policy(policy)
+    candidates = variants
+    if field:
+        candidates = [v for v in variants if getattr(v, field) and getattr(v, field) <= limit]
+        if not candidates:
+            return min(variants, key=lambda v: (getattr(v, field) or 0, v.bandwidth))
+    return max(candidates, key=lambda v: v.bandwidth)
+
+
+def filter_master(content: str, policy: str = 'best', advertised_bandwidth: int = 0) -> str:
+    """
+    Reduce a master playlist to the variant chosen by the policy and the
+    audio renditions of its AUDIO group.
+
+    Args:
+        content: Master playlist text
+        policy: Variant policy (see parse_policy)
+        advertised_bandwidth: BANDWIDTH written for the chosen variant, 0
+            keeps the real one
+
+    Returns:
+        Filtered master playlist text
+    """
+    playlist = parse_master(content)
+    variant = select_variant(playlist.variants, policy)
+    if variant is None:
+        return serialize_master(playlist)
+
+    audio_group = variant.attributes.get('AUDIO')
+    playlist.media = [
+        media for media in playlist.media
+        if media.get('TYPE') != 'AUDIO' or media.get('GROUP-ID') == audio_group
+    ]
+    if advertised_bandwidth:
+        variant.attributes = dict(variant.attributes)
+        variant.attributes['BANDWIDTH'] = str(advertised_bandwidth)
+    playlist.variants = [variant]
+    return serialize_master(playlist)
+
+
+def fetch(url: str, timeout: float = 10) -> str:
+    """
+    GET a playlist through the shared keep-alive session.
+
+    Returns:
+        Playlist text, None if the request failed
+    """
+    try:
+        response = session.get(url, timeout=timeout)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    response.encoding = 'utf-8'
+    return response.text